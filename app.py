@@ -1,80 +1,39 @@
-import asyncio
 import streamlit as st
-from google import genai
-import os
 import glob
-import time
 from dotenv import load_dotenv
-from google.genai import types
-from PIL import Image
-from countryinfo import CountryInfo
-from tavily import TavilyClient
-from strands import Agent, tool
-from strands.models.gemini import GeminiModel
-from strands.agent.conversation_manager import SummarizingConversationManager
-from io import BytesIO
-from mem0 import MemoryClient
-import base64
+from contextlib import nullcontext
 from datetime import datetime
-import json
-import sqlite3
 import uuid
+import hashlib
+import re
 
-# Database setup
-DB_PATH = 'data.db'  # SQLite file path; can be adjusted for cloud deployments
+# Load environment variables (before the project modules, which read settings at import time)
+load_dotenv()
 
-def init_db():
-    """Initialize the database and create tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Table for users (to manage sessions)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Table for conversations (chat history per user)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS conversations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            conversation_id TEXT NOT NULL,
-            title TEXT,
-            messages TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    # Table for memories (to integrate with mem0)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS memories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            memory_data TEXT,  
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (user_id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+# Database setup
+from database import (
+    init_db, load_conversations, count_conversations, load_conversation_messages,
+    insert_conversation, clear_conversation_messages, delete_conversation,
+    load_image, format_preview
+)
 
 # Initialize DB on app start
 init_db()
 
-# Helper function to get DB connection
-def get_db_connection():
-    """Get a database connection."""
-    return sqlite3.connect(DB_PATH)
+# Image ingestion (orientation, downscaling and re-encoding before model calls)
+from images import ingest_image
 
-# Load environment variables
-load_dotenv()
+# Latency tracing (spans around the agent, tools, database and image work)
+from tracing import collect, latency_breakdown, set_tags, span
+
+# User memory (mem0) with a per-user cache and background batched writes
+from memory import prefetch_memories
+
+# The StyleGenie agent (system prompt and tools)
+from style_genie_agent import initialize_agent
+
+# A chat turn: agent input, the (streamed) agent call and saving the turn
+from chat import run_turn
 
 # Language translations
 TRANSLATIONS = {
@@ -111,7 +70,15 @@ TRANSLATIONS = {
         "rename_chat": "✏️ Rename",
         "no_conversations": "No conversations yet. Start chatting!",
         "conversation_title": "New Conversation",
-        "confirm_delete": "Delete this conversation?"
+        "confirm_delete": "Delete this conversation?",
+        "load_more_conversations": "⬇️ Load older conversations",
+        "load_earlier_messages": "⬆️ Load earlier messages",
+        "message_count": "{count} messages",
+        "latency_breakdown": "⏱️ Response time breakdown",
+        "tool_generate_image": "🎨 Editing your image…",
+        "tool_web_search": "🔍 Searching the web…",
+        "tool_user_country": "🌍 Looking up country info…",
+        "tool_memories": "🧠 Checking your preferences…"
     },
     "Français": {
         "page_title": "StyleGenie : Votre Assistant Mode Personnel",
@@ -146,7 +113,15 @@ TRANSLATIONS = {
         "rename_chat": "✏️ Renommer",
         "no_conversations": "Aucune conversation. Commencez à discuter !",
         "conversation_title": "Nouvelle Conversation",
-        "confirm_delete": "Supprimer cette conversation ?"
+        "confirm_delete": "Supprimer cette conversation ?",
+        "load_more_conversations": "⬇️ Charger les conversations plus anciennes",
+        "load_earlier_messages": "⬆️ Charger les messages précédents",
+        "message_count": "{count} messages",
+        "latency_breakdown": "⏱️ Détail du temps de réponse",
+        "tool_generate_image": "🎨 Modification de votre image…",
+        "tool_web_search": "🔍 Recherche sur le web…",
+        "tool_user_country": "🌍 Recherche d'informations sur le pays…",
+        "tool_memories": "🧠 Consultation de vos préférences…"
     },
     "Español": {
         "page_title": "StyleGenie: Tu Asistente Personal de Moda",
@@ -181,7 +156,15 @@ TRANSLATIONS = {
         "rename_chat": "✏️ Renombrar",
         "no_conversations": "No hay conversaciones. ¡Empieza a chatear!",
         "conversation_title": "Nueva Conversación",
-        "confirm_delete": "¿Eliminar esta conversación?"
+        "confirm_delete": "¿Eliminar esta conversación?",
+        "load_more_conversations": "⬇️ Cargar conversaciones anteriores",
+        "load_earlier_messages": "⬆️ Cargar mensajes anteriores",
+        "message_count": "{count} mensajes",
+        "latency_breakdown": "⏱️ Desglose del tiempo de respuesta",
+        "tool_generate_image": "🎨 Editando tu imagen…",
+        "tool_web_search": "🔍 Buscando en la web…",
+        "tool_user_country": "🌍 Consultando información del país…",
+        "tool_memories": "🧠 Revisando tus preferencias…"
     },
     "Deutsch": {
         "page_title": "StyleGenie: Dein Persönlicher Mode-Assistent",
@@ -216,7 +199,15 @@ TRANSLATIONS = {
         "rename_chat": "✏️ Umbenennen",
         "no_conversations": "Keine Unterhaltungen. Fang an zu chatten!",
         "conversation_title": "Neue Unterhaltung",
-        "confirm_delete": "Diese Unterhaltung löschen?"
+        "confirm_delete": "Diese Unterhaltung löschen?",
+        "load_more_conversations": "⬇️ Ältere Unterhaltungen laden",
+        "load_earlier_messages": "⬆️ Frühere Nachrichten laden",
+        "message_count": "{count} Nachrichten",
+        "latency_breakdown": "⏱️ Aufschlüsselung der Antwortzeit",
+        "tool_generate_image": "🎨 Bearbeite dein Bild…",
+        "tool_web_search": "🔍 Suche im Web…",
+        "tool_user_country": "🌍 Suche Länderinformationen…",
+        "tool_memories": "🧠 Prüfe deine Vorlieben…"
     }
 }
 
@@ -225,81 +216,7 @@ def get_text(key):
     lang = st.session_state.get('language', 'English')
     return TRANSLATIONS[lang].get(key, TRANSLATIONS['English'][key])
 
-# Conversation management functions (Database-based)
-def ensure_user_exists(user_id):
-    """Ensure a user record exists in the database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
-    conn.commit()
-    conn.close()
-
-def load_conversations(user_id):
-    """Load conversations from database for a specific user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Ensure user exists
-    ensure_user_exists(user_id)
-    
-    # Load conversations
-    cursor.execute('''
-        SELECT conversation_id, title, messages, created_at, updated_at
-        FROM conversations
-        WHERE user_id = ?
-        ORDER BY updated_at DESC
-    ''', (user_id,))
-    
-    rows = cursor.fetchall()
-    conversations = {}
-    
-    for row in rows:
-        conv_id, title, messages_json, created_at, updated_at = row
-        try:
-            messages = json.loads(messages_json) if messages_json else []
-        except json.JSONDecodeError:
-            messages = []
-        
-        conversations[conv_id] = {
-            'id': conv_id,
-            'title': title or f"{get_text('conversation_title')} - {created_at}",
-            'messages': messages,
-            'created_at': created_at,
-            'updated_at': updated_at
-        }
-    
-    conn.close()
-    return conversations
-
-def save_conversations(conversations, user_id):
-    """Save conversations to database for a specific user"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Ensure user exists
-    ensure_user_exists(user_id)
-    
-    # Delete existing conversations for this user
-    cursor.execute('DELETE FROM conversations WHERE user_id = ?', (user_id,))
-    
-    # Insert updated conversations
-    for conv_id, conv_data in conversations.items():
-        messages_json = json.dumps(conv_data.get('messages', []), ensure_ascii=False)
-        cursor.execute('''
-            INSERT INTO conversations (user_id, conversation_id, title, messages, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id,
-            conv_id,
-            conv_data.get('title', ''),
-            messages_json,
-            conv_data.get('created_at', datetime.now().strftime("%Y-%m-%d %H:%M")),
-            conv_data.get('updated_at', datetime.now().strftime("%Y-%m-%d %H:%M"))
-        ))
-    
-    conn.commit()
-    conn.close()
-
+# Conversation management functions
 def create_new_conversation():
     """Create a new conversation"""
     conv_id = str(uuid.uuid4())
@@ -307,38 +224,16 @@ def create_new_conversation():
     return {
         'id': conv_id,
         'title': f"{get_text('conversation_title')} - {timestamp}",
-        'messages': [],
+        'preview': None,
+        'message_count': 0,
         'created_at': timestamp,
         'updated_at': timestamp
     }
 
-def delete_conversation(user_id, conversation_id):
-    """Delete a specific conversation from the database"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM conversations WHERE user_id = ? AND conversation_id = ?', (user_id, conversation_id))
-    conn.commit()
-    conn.close()
-
-def update_conversation_title(user_id, conversation_id, new_title):
-    """Update the title of a conversation"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE conversations
-        SET title = ?, updated_at = ?
-        WHERE user_id = ? AND conversation_id = ?
-    ''', (new_title, datetime.now().strftime("%Y-%m-%d %H:%M"), user_id, conversation_id))
-    conn.commit()
-    conn.close()
-
-def get_conversation_preview(messages, max_length=50):
-    """Get a preview of the conversation from first user message"""
-    for msg in messages:
-        if msg['role'] == 'user':
-            preview = msg['content'][:max_length]
-            return preview + '...' if len(msg['content']) > max_length else preview
-    return get_text('conversation_title')
+def move_conversation_to_top(conv_id):
+    """Move a conversation to the top of the sidebar list, which is kept in updated_at order without re-sorting"""
+    conversations = st.session_state.conversations
+    st.session_state.conversations = {conv_id: conversations.pop(conv_id), **conversations}
 
 # Page configuration
 st.set_page_config(
@@ -938,516 +833,82 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# System prompt
-style_genie_system_prompt = """<system_prompt>
-
-🧥 **STYLE GENIE — MULTILINGUAL AI FASHION DESIGNER, PERSONAL STYLIST & SHOPPING EXPERT**
-
-YOU ARE **STYLE GENIE**, THE WORLD’S MOST ADVANCED MULTILINGUAL AI FASHION ADVISOR.  
-YOUR MISSION IS TO **ASSIST USERS IN ANALYZING, STYLING, ENHANCING, AND SOURCING OUTFITS** WHILE MAINTAINING THEIR UNIQUE IDENTITY AND PERSONAL STYLE.
-
----
-
-### 🌟 TONE & PERSONA
-
-- YOU SPEAK AS A **FRIENDLY, PROFESSIONAL, AND ENTHUSIASTIC STYLIST** — confident but never arrogant.  
-- YOUR VOICE IS **CONVERSATIONAL, POSITIVE, AND CREATIVE**, blending expertise with encouragement.  
-- USE contractions naturally (e.g., “I’ll”, “you’re”, “that’s”).  
-- KEEP messages concise but insightful — aim for clarity, warmth, and excitement.
-
----
-
-### 🧠 MEMORY SYSTEM INTEGRATION
-
-YOU HAVE ACCESS TO THREE MEMORY TOOLS:
-
-- **`add_memories(prompt, user_id)`** → STORE new user information (preferences, brands, colors, etc.)  
-- **`search_memories(prompt, user_id)`** → RECALL previously discussed topics  
-- **`get_all_memories(prompt, user_id)`** → RETRIEVE all stored user data for personalization  
-
-#### RULES FOR MEMORY BEHAVIOR
-1. **CALL `get_all_memories()` ON FIRST MESSAGE** in a new session to check if data exists.  
-2. **ASK POLITELY FOR USER’S NAME** only if no memory exists. Example:  
-   > “To personalize your experience, could you please tell me your name?”  
-3. **ONCE NAME IS GIVEN**, immediately store it using `add_memories("User's name is [name]", "{USER_ID}")`.  
-4. **NEVER ASK AGAIN** for name or data already known in the current session.  
-5. **WHEN USER REFERS TO PAST DISCUSSIONS**, use `search_memories()` to recall context.  
-6. **SUMMARIZE STORED DATA NATURALLY**, never print raw memory content.  
-7. **ONLY STORE FACTUAL USER-APPROVED INFORMATION**, not assumptions or inferred data.  
-
----
-
-### 🪪 USER IDENTITY MANAGEMENT
-
-- Each session uses a persistent `"{USER_ID}"`.  
-- All memory operations MUST use this same identifier.  
-- If a user refuses to share their name, reply courteously:  
-  > “No problem! I’ll continue without saving your preferences this time.”  
-- Do not attempt to infer the user’s name or private information.
-
----
-
-### 🧭 CORE CAPABILITIES
-
-1. **STYLE ANALYSIS** — Analyze uploaded outfits and describe key elements (fit, color, aesthetic).  
-2. **OUTFIT MODIFICATION** — Use `generate_image(prompt)` to apply style changes while **preserving the user’s identity**.  
-3. **SHOPPING ASSISTANCE** — Find product links or alternatives using `web_search()`. **ALWAYS include relevant URLs from search results in your response** when providing shopping recommendations or product information. **ALWAYS ask for country and budget if not already known** when the user requests outfit searches or links. If an outfit was just generated, ask if they want to search for the original image or the generated one. Use `user_country()` to adapt to local trends and availability.  
-4. **CULTURAL CONTEXTUALIZATION** — When asked, adapt style advice to local weather, traditions, or trends using `user_country()`.  
-5. **MEMORY-AWARE PERSONALIZATION** — Integrate user history into every response.  
-6. **MULTILINGUAL DIALOGUE** — Respond fluently and consistently in the user’s active language.  
-
----
-
-### 🌐 MULTILINGUAL BEHAVIOR RULES
-
-- **DETECT** the language of the latest user message.  
-- **RESPOND** in that exact language unless explicitly told otherwise.  
-- **MAINTAIN CONSISTENCY** in tone across languages — friendly, refined, confident.  
-- If detection fails, default to English and add:  
-  > “I’ll respond in English for now — feel free to switch languages anytime!”
-
----
-
-### 🖼️ IMAGE GENERATION PROTOCOL
-
-- When modifying outfits, call **`generate_image(detailed_prompt)`**.  
-- ENSURE:
-  - Only requested changes are made (e.g., jacket → leather, color → white).  
-  - Face, body, and background remain untouched.  
-  - Output looks **photorealistic and natural**.  
-- If no image is uploaded, reply politely:  
-  > “Please upload an image so I can visualize your outfit adjustments.”
-
----
-
-### ⚙️ WORKFLOW SUMMARY
-
-| **User Intent** | **Action Sequence** |
-|------------------|--------------------|
-| First message | `get_all_memories("user info", "{USER_ID}")` → check if name exists |
-| No name stored | Ask politely → save name with `add_memories()` |
-| **User Style Edit Request** | **IMMEDIATELY** `generate_image(detailed_prompt)` → factual description → optionally `web_search()` for similar items → **Optional Suggestion** |
-| Shopping request | Ask for missing info (country/budget) → use `user_country()` + `web_search()` |
-| Feedback or opinion | Use `search_memories()` if relevant → provide insight and new suggestion |
-| New preference shared | Save via `add_memories()` immediately |
-
----
+# Show a per-turn latency breakdown (agent, tools, database, images) under each answer
+SHOW_LATENCY_PANEL = False
 
-### 🧩 CHAIN OF THOUGHT PROCESS
+def show_latency_panel(turn_spans):
+    """Render the time spent per span name during the last turn"""
+    with st.expander(get_text('latency_breakdown')):
+        st.table([
+            {"span": entry["name"], "calls": entry["calls"], "total ms": round(entry["total_ms"], 1), "max ms": round(entry["max_ms"], 1)}
+            for entry in latency_breakdown(turn_spans)
+        ])
 
-FOLLOW THIS INTERNAL REASONING SEQUENCE (DO NOT DISPLAY TO USER):
+# Chat messages rendered per page; "load earlier messages" adds one page at a time
+CHAT_PAGE_SIZE = {"mobile": 12, "desktop": 30}
+MOBILE_USER_AGENT = re.compile(r"Mobi|Android|iPhone|iPad|iPod", re.IGNORECASE)
 
-1. **UNDERSTAND** → Identify what the user wants (e.g., advice, image edit, outfit match).  
-2. **CHECK SESSION CONTEXT** → Determine if it’s a new chat or continuation.  
-3. **BASICS** → Extract garments, preferences, or missing data (country, budget).  
-4. **ANALYZE** → Search or recall past preferences via memory tools if needed.  
-5. **EXECUTE** → Perform the primary action (style advice, search, or image generation).  
-6. **EVALUATE** → Verify if the result fulfills the user’s intent; refine if needed.  
-7. **FINAL ANSWER** → Present response in the user’s language, with enthusiasm and clear formatting.
-
----
-
-### 🧷 RESPONSE FORMATTING GUIDELINES
-
-- ALWAYS combine **visual description + reasoning + suggestion**.  
-- Structure with clear paragraph breaks.  
-- When applicable, end with a **friendly CTA (call to action)** such as:  
-  > “Would you like me to create a visual version of that?” or  
-  > “Want me to find some shopping links for this look?”
-
----
-
-### 🚫 WHAT NOT TO DO
-
-- ❌ NEVER show or reveal raw memory data or database content.  
-- ❌ NEVER ask for the user’s name or data more than once per session.  
-- ❌ NEVER modify a person’s face, body, or pose during image generation.  
-- ❌ NEVER switch languages unless explicitly requested.  
-- ❌ NEVER provide brand links without verifying via `web_search()`.  
-- ❌ NEVER produce generic fashion advice without personalization or reasoning.  
-- ❌ NEVER repeat tool outputs verbatim — always explain results conversationally.
-
----
-
-### ✅ EXAMPLES (FEW-SHOT)
-
-**User:** “Change my jacket to white leather.”  
-**Assistant:**  
-> “Got it! I’ll transform your jacket into a white leather style while keeping everything else identical — including your pose and lighting. Let’s see the result!”  
-→ *(Calls `generate_image()`)*
-
----
-
-**User:** “I love minimalist tones.”  
-**Assistant:**  
-> “Perfect — I’ll remember that. You seem drawn to clean lines and neutral shades. Want me to find similar outfits online?”  
-→ *(Calls `add_memories()` and optionally `web_search()`)*
-
----
-
-**User:** “Find me summer outfits for Italy.”  
-**Assistant:**  
-> “Excellent choice! Let’s tailor your look for the Italian summer vibe — light fabrics, Mediterranean colors. Checking current trends...”  
-→ *(Calls `user_country("Italy")` + `web_search("Italian summer fashion")`)*
-
----
-
-</system_prompt>
-
-
-"""
-
-# Initialize genai client (cached to avoid recreation)
-@st.cache_resource
-def get_genai_client():
-    # Try to get API key from Streamlit secrets first, then fall back to environment variable
+def get_chat_page_size():
+    """Return the chat page size for the current browser (mobile or desktop, from its User-Agent)"""
     try:
-        api_key = st.secrets.get("GOOGLE_API_KEY", os.environ.get("GOOGLE_API_KEY"))
-    except:
-        api_key = os.environ.get("GOOGLE_API_KEY")
-    
-    if not api_key:
-        raise ValueError("GOOGLE_API_KEY not found in secrets or environment variables")
-    
-    try:
-        client = genai.Client(api_key=api_key)
-        return client
-    except Exception as e:
-        st.error(f"Failed to initialize genai client: {e}")
-        raise
-
-# Tool definitions
-@tool
-async def generate_image(prompt: str) -> str:
-    """" 
-    This function allows you to generate an image based on the user's query.
-    It modifies the current image that the user uploaded while preserving their identity.
-
-    Args :
-
-    prompt : the user's modification request (e.g., "change the jacket to white leather")
-
-    Returns :
-
-    Status message indicating success or failure
-    
-    """
-    global current_image_bytes
-    
-    if current_image_bytes is None:
-        return "Error: No image available to modify. Please upload an image first."
-
-    system_prompt = """You are an AI image editor specializing in outfit modifications. 
-When modifying clothing in images, you must:
-- Change ONLY the requested clothing items, colors, or accessories
-- Preserve the person's face, body, pose, hairstyle, and background exactly as they are
-- Keep all other elements of the image unchanged
-- Generate realistic and natural-looking results
-- The input image shows the person whose outfit you need to modify"""
-    
-    try:
-        api_key = st.secrets.get("GEMINI_API_KEY", os.environ.get("GEMINI_API_KEY"))
-    except:
-        api_key = os.environ.get("GEMINI_API_KEY")
-    
-    if not api_key:
-        return "Error: GEMINI_API_KEY not found in environment variables or secrets."
-    
-    try:
-        client = genai.Client(api_key=api_key)
-        
-        # Get image bytes from global variable
-        image_bytes = current_image_bytes
-        
-        # Create the image part from bytes
-        image_part = types.Part.from_bytes(
-            data=image_bytes,
-            mime_type="image/jpeg"
-        )
-        
-        # Send both the original image and the modification prompt
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview",
-            contents=[image_part, prompt],
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                response_modalities=['Text', 'Image']
-            )
-        )
-
-        # Process response
-        full_response = ""
-        generated_image = None
-        
-        try:
-            for part in response.candidates[0].content.parts:
-                if part.text is not None:
-                    full_response += part.text
-                elif part.inline_data is not None:
-                    try:
-                        generated_image = Image.open(BytesIO(part.inline_data.data))
-
-                        # Validate image dimensions
-                        if generated_image.size[0] <= 0 or generated_image.size[1] <= 0:
-                            print(f"Invalid image dimensions: {generated_image.size}")
-                            full_response = "Error: Generated image has invalid dimensions. Please try again."
-                            generated_image = None
-                            continue
-
-                        # Convert image to bytes for display in chat
-                        img_byte_arr = BytesIO()
-                        generated_image.save(img_byte_arr, format='PNG')
-                        image_bytes = img_byte_arr.getvalue()
-
-                        # Store image bytes in global variable and session state
-                        update_generated_image(image_bytes)
-
-                        try:
-                            if hasattr(st, 'session_state'):
-                                if 'generated_images' not in st.session_state:
-                                    st.session_state.generated_images = []
-                                st.session_state.generated_images.append(image_bytes)
-                                st.session_state.latest_generated_image = image_bytes
-                                print(f"Image stored in session state: {len(image_bytes)} bytes")
-                            else:
-                                print("No session state available in tool context")
-                        except Exception as e:
-                            print(f"Error storing image in session state: {e}")
-                            pass
-
-                        print("Image generated successfully and stored in memory")
-                    except Exception as img_error:
-                        print(f"Error processing generated image: {img_error}")
-                        full_response = f"Error processing generated image: {str(img_error)}. Please try again."
-                        generated_image = None
-        except Exception as ex:
-            full_response = f"ERROR in image generation: {str(ex)}"
-            generated_image = None
-        
-        if generated_image is not None:
-            return "Image successfully modified and saved. The person's identity and pose have been preserved."
-        else:
-            return full_response if full_response else "Image modification completed but no image was generated in the response."
-    
-    except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Error in generate_image: {error_details}")
-        return f"Error generating image: {str(e)}"
+        user_agent = st.context.headers.get("User-Agent", "")
+    except Exception:
+        user_agent = ""
+    return CHAT_PAGE_SIZE["mobile" if MOBILE_USER_AGENT.search(user_agent or "") else "desktop"]
+
+# Status line shown in the chat while a tool runs
+TOOL_STATUS_KEYS = {
+    "generate_image": "tool_generate_image",
+    "web_search": "tool_web_search",
+    "user_country": "tool_user_country",
+    "get_all_memories": "tool_memories",
+    "search_memories": "tool_memories",
+    "add_memories": "tool_memories",
+}
 
+def get_session_agent():
+    """Return this session's agent, building a new one only when the user, language or conversation changed.
 
-@tool
-async def web_search(search: str) -> dict:
-    """
-    This function allows the model to make searches online based on a subject given by the user.
-    
-    Args:
-        search: the user's query
-    
-    Returns:
-        Dictionary with search results including titles, URLs, and content snippets
+    The agent is kept in session state, so it survives reruns together with its
+    conversation manager. Tools do not capture any session data at build time:
+    the images they work on are passed with each call (see new_turn_images).
     """
-    try:
-        api_key = st.secrets.get("TAVILY_API_KEY", os.environ.get("TAVILY_API_KEY"))
-    except:
-        api_key = os.environ.get("TAVILY_API_KEY")
-    
-    tavily_client = TavilyClient(api_key=api_key)
-    
-    # Use basic search for faster results
-    response = tavily_client.search(
-        search,
-        search_depth="advanced",
-        max_results=5
+    agent_key = (
+        st.session_state.user_id,
+        st.session_state.language,
+        st.session_state.current_conversation_id,
     )
-    
-    if 'results' in response:
-        formatted_results = []
-        for result in response['results']:
-            formatted_results.append({
-                'title': result.get('title', 'No title'),
-                'url': result.get('url', 'No URL'),
-                'content': result.get('content', 'No description'),
-                'score': result.get('score', 0)
-            })
-        return {
-            'results': formatted_results,
-            'total_results': len(formatted_results)
-        }
-    
-    return {'results': [], 'total_results': 0}
-
+    if st.session_state.get("agent") is None or st.session_state.get("agent_key") != agent_key:
+        st.session_state.agent = initialize_agent(st.session_state.user_id)
+        st.session_state.agent_key = agent_key
+        # Load the user's memories while they type, for the new agent's first turn
+        st.session_state.memory_prefetch = prefetch_memories(st.session_state.user_id)
+    return st.session_state.agent
 
-@tool
-async def user_country(name: str) -> dict:
-    """
-    This function allows you to find information about the user's country.
-    """
-    try:
-        country = CountryInfo(name)
-        country_infos = {
-            'capital': country.capital(),
-            'currencies': country.currencies(),
-            'languages': country.languages(),
-            'borders': country.borders(),
-            'area': country.area(),
-            'calling_codes': country.calling_codes(),
-            'timezones': country.timezones(),
-            'population': country.population()
-        }
-        return country_infos
-    except Exception as e:
-        return {'error': str(e)}
+MAX_SESSION_UPLOADS = 4  # Processed uploads kept per session
 
+def get_session_upload(uploaded_file):
+    """Return the processed record of an uploaded or captured image, processing it at most once per session.
 
-@tool
-async def add_memories(prompt: str, user_id: str) -> dict:
+    Records are kept in memory in st.session_state.uploads, keyed by content
+    hash; Streamlit's file_id maps the widget's current file to its record so
+    reruns skip even the hashing.
     """
-    This function tool allows you to save the user's message.
-    
-    Args:
-        prompt: the user's query
-        user_id: the user's id
-    
-    Returns:
-        The status of the function tool usage
-    """
-    try:
-        memory_api_key = st.secrets.get('MEM0_API_KEY', os.environ.get('MEM0_API_KEY'))
-    except:
-        memory_api_key = os.environ.get('MEM0_API_KEY')
-    
-    if not memory_api_key:
-        print("ERROR: MEM0_API_KEY not found in environment variables or secrets")
-        return {"status": "error", "message": "MEM0_API_KEY not found"}
-    
-    client = MemoryClient(memory_api_key)
-    
-    message = {
-        "role": "user",
-        "content": prompt
-    }
-    
-    try:
-        client.add([message], user_id=user_id)
-        print(f"Memory added successfully for user: {user_id}")
-        return {"status": "success"}
-    except Exception as e:
-        print(f"Error adding memory for user {user_id}: {str(e)}")
-        return {"status": "error", "message": str(e)}
-
-
-@tool
-async def search_memories(prompt: str, user_id: str) -> dict:
-    """
-    This function tool allows you to search for relevant memories.
-    
-    Args:
-        prompt: the search query
-        user_id: the user's id
-    
-    Returns:
-        The status of the function tool usage
-    """
-    try:
-        memory_api_key = st.secrets.get('MEM0_API_KEY', os.environ.get('MEM0_API_KEY'))
-    except:
-        memory_api_key = os.environ.get('MEM0_API_KEY')
-    
-    client = MemoryClient(memory_api_key)
-    
-    filters = {
-        "AND": [
-            {
-                "user_id": user_id
-            }
-        ]
-    }
-    
-    try:
-        results = client.search(prompt, version="v2", filters=filters)
-        num_results = len(results) if results else 0
-        print(f"Memory search successful for user: {user_id}, found {num_results} results")
-        return {"status": "success", "results": results}
-    except Exception as e:
-        print(f"Error searching memories for user {user_id}: {str(e)}")
-        return {"status": "error", "message": str(e)}
-
-
-@tool
-async def get_all_memories(prompt: str, user_id: str) -> dict:
-    """
-    This function allows you to retrieve all memories of a user.
-    
-    Args:
-        prompt: the user's query
-        user_id: the user's id
-    
-    Returns:
-        The status of the function tool usage
-    """
-    try:
-        memory_api_key = st.secrets.get('MEM0_API_KEY', os.environ.get('MEM0_API_KEY'))
-    except:
-        memory_api_key = os.environ.get('MEM0_API_KEY')
-    
-    client = MemoryClient(memory_api_key)
-    
-    filters = {
-        "AND": [
-            {
-                "user_id": user_id
-            }
-        ]
-    }
-    
-    try:
-        all_memories = client.get_all(version="v2", filters=filters, page=1, page_size=50)
-        print(f"Retrieved {len(all_memories) if all_memories else 0} memories for user: {user_id}")
-        return {"status": "success", "memories": all_memories}
-    except Exception as e:
-        print(f"Error getting all memories for user {user_id}: {str(e)}")
-        return {"status": "error", "message": str(e)}
-
-
-# Initialize the agent (removed caching to allow tools to access current session state)
-def initialize_agent(user_id):
-    """Initialize agent with user-specific system prompt"""
-    api_key = os.environ.get("GEMINI_API_KEY")
-    
-    # Inject the actual user_id into the system prompt
-    personalized_prompt = style_genie_system_prompt.replace("{USER_ID}", user_id)
-    
-    model = GeminiModel(
-        client_args={
-            'api_key': api_key,
-        },
-        model_id="gemini-2.5-flash",
-    )
-    
-    agent = Agent(
-        model=model,
-        tools=[generate_image, user_country, web_search, get_all_memories, search_memories, add_memories],
-        system_prompt=personalized_prompt,
-        conversation_manager=SummarizingConversationManager()
-    )
-    
-    return agent
-
-
-# Global variables to store images
-current_image_bytes = None
-latest_generated_image_bytes = None
-
-def update_current_image(image_bytes):
-    """Updates the global current_image_bytes variable."""
-    global current_image_bytes
-    current_image_bytes = image_bytes
-
-def update_generated_image(image_bytes):
-    """Updates the global latest_generated_image_bytes variable."""
-    global latest_generated_image_bytes
-    latest_generated_image_bytes = image_bytes
+    file_id = getattr(uploaded_file, "file_id", None)
+    upload_hash = st.session_state.upload_ids.get(file_id) if file_id else None
+    
+    if upload_hash not in st.session_state.uploads:
+        upload_bytes = uploaded_file.getvalue()
+        upload_hash = hashlib.sha256(upload_bytes).hexdigest()
+        if upload_hash not in st.session_state.uploads:
+            st.session_state.uploads[upload_hash] = ingest_image(upload_bytes)
+            # Drop the oldest uploads beyond the per-session limit
+            while len(st.session_state.uploads) > MAX_SESSION_UPLOADS:
+                del st.session_state.uploads[next(iter(st.session_state.uploads))]
+        if file_id:
+            st.session_state.upload_ids[file_id] = upload_hash
+    
+    return st.session_state.uploads[upload_hash]
 
 # Initialize session state
 # Generate unique user ID for this session to isolate memories per user
@@ -1456,7 +917,12 @@ if "user_id" not in st.session_state:
     print(f"New user session created with ID: {st.session_state.user_id}")
 
 if "conversations" not in st.session_state:
-    st.session_state.conversations = load_conversations(st.session_state.user_id)
+    # Only the first page of conversation metadata is loaded; messages are loaded per conversation
+    st.session_state.conversations = load_conversations(
+        st.session_state.user_id,
+        default_title=get_text('conversation_title')
+    )
+    st.session_state.conversations_total = count_conversations(st.session_state.user_id)
 
 if "current_conversation_id" not in st.session_state:
     # Create first conversation if none exist
@@ -1464,36 +930,35 @@ if "current_conversation_id" not in st.session_state:
         new_conv = create_new_conversation()
         st.session_state.conversations[new_conv['id']] = new_conv
         st.session_state.current_conversation_id = new_conv['id']
-        save_conversations(st.session_state.conversations, st.session_state.user_id)
+        insert_conversation(st.session_state.user_id, new_conv)
+        st.session_state.conversations_total += 1
     else:
         # Load the most recent conversation
-        st.session_state.current_conversation_id = list(st.session_state.conversations.keys())[-1]
+        st.session_state.current_conversation_id = list(st.session_state.conversations.keys())[0]
 
 if "messages" not in st.session_state:
     # Load messages from current conversation
-    current_conv = st.session_state.conversations.get(st.session_state.current_conversation_id, {})
-    st.session_state.messages = current_conv.get('messages', [])
+    st.session_state.messages = load_conversation_messages(st.session_state.current_conversation_id)
 
 if "uploaded_image" not in st.session_state:
     st.session_state.uploaded_image = None
 
+if "uploads" not in st.session_state:
+    # Processed uploads of this session by content hash, and Streamlit file ids mapped to those hashes
+    st.session_state.uploads = {}
+    st.session_state.upload_ids = {}
+
 if "generated_image" not in st.session_state:
     st.session_state.generated_image = None
 
-if "generated_images" not in st.session_state:
-    st.session_state.generated_images = []
-
-if "latest_generated_image" not in st.session_state:
-    st.session_state.latest_generated_image = None
-
-# Initialize agent fresh each time to ensure tools have access to current session state
-st.session_state.agent = initialize_agent(st.session_state.user_id)
-
 if "language" not in st.session_state:
     st.session_state.language = "English"
 
-if "current_image_bytes" not in st.session_state:
-    st.session_state.current_image_bytes = None
+# Reuse the session's agent across reruns (rebuilt only when user, language or conversation change)
+get_session_agent()
+
+# Tag this run's spans with the session and conversation they belong to
+set_tags(session_id=st.session_state.user_id, conversation_id=st.session_state.current_conversation_id)
 
 
 # Language selector at the top with better mobile layout
@@ -1530,32 +995,26 @@ with st.sidebar:
     if st.button(get_text('new_chat'), use_container_width=True, type="primary"):
         new_conv = create_new_conversation()
         st.session_state.conversations[new_conv['id']] = new_conv
+        move_conversation_to_top(new_conv['id'])
         st.session_state.current_conversation_id = new_conv['id']
         st.session_state.messages = []
         st.session_state.uploaded_image = None
-        st.session_state.generated_images = []
-        save_conversations(st.session_state.conversations, st.session_state.user_id)
+        insert_conversation(st.session_state.user_id, new_conv)
+        st.session_state.conversations_total += 1
         st.rerun()
     
     st.markdown('<div class="sidebar-divider"></div>', unsafe_allow_html=True)
     
-    # Display conversations list
+    # Display conversations list (loaded page by page from SQL, already most recent first)
     if st.session_state.conversations:
-        # Sort conversations by updated_at (most recent first)
-        sorted_convs = sorted(
-            st.session_state.conversations.items(),
-            key=lambda x: x[1].get('updated_at', ''),
-            reverse=True
-        )
-        
-        for conv_id, conv in sorted_convs:
+        for conv_id, conv in list(st.session_state.conversations.items()):
             # Mobile-optimized conversation item
             with st.container():
                 col1, col2 = st.columns([5, 1], gap="small")
                 
                 with col1:
                     # Get conversation preview
-                    preview = get_conversation_preview(conv.get('messages', []))
+                    preview = conv.get('preview') or get_text('conversation_title')
                     
                     # Highlight current conversation
                     is_current = conv_id == st.session_state.current_conversation_id
@@ -1567,13 +1026,14 @@ with st.sidebar:
                     if st.button(
                         button_label,
                         key=f"conv_{conv_id}",
+                        help=get_text('message_count').format(count=conv.get('message_count', 0)),
                         use_container_width=True,
                         disabled=is_current,
                         type=button_style
                     ):
                         # Switch to this conversation
                         st.session_state.current_conversation_id = conv_id
-                        st.session_state.messages = conv.get('messages', [])
+                        st.session_state.messages = load_conversation_messages(conv_id)
                         st.rerun()
                 
                 with col2:
@@ -1581,13 +1041,14 @@ with st.sidebar:
                     if st.button("🗑️", key=f"del_{conv_id}", help=get_text('delete_chat'), use_container_width=True):
                         if len(st.session_state.conversations) > 1:
                             del st.session_state.conversations[conv_id]
-                            save_conversations(st.session_state.conversations, st.session_state.user_id)
+                            delete_conversation(st.session_state.user_id, conv_id)
+                            st.session_state.conversations_total -= 1
                             
                             # Switch to another conversation if current was deleted
                             if conv_id == st.session_state.current_conversation_id:
                                 new_current = list(st.session_state.conversations.keys())[0]
                                 st.session_state.current_conversation_id = new_current
-                                st.session_state.messages = st.session_state.conversations[new_current].get('messages', [])
+                                st.session_state.messages = load_conversation_messages(new_current)
                             
                             st.rerun()
                         else:
@@ -1595,6 +1056,18 @@ with st.sidebar:
                 
                 # Add spacing between conversations for better mobile UX
                 st.markdown('<div class="conversation-spacer"></div>', unsafe_allow_html=True)
+        
+        # Load the next page of older conversations on demand
+        if len(st.session_state.conversations) < st.session_state.conversations_total:
+            if st.button(get_text('load_more_conversations'), key="load_more_conversations", use_container_width=True):
+                older = load_conversations(
+                    st.session_state.user_id,
+                    offset=len(st.session_state.conversations),
+                    default_title=get_text('conversation_title')
+                )
+                for older_id, older_conv in older.items():
+                    st.session_state.conversations.setdefault(older_id, older_conv)
+                st.rerun()
     else:
         st.info(get_text('no_conversations'))
     
@@ -1621,47 +1094,25 @@ with st.sidebar:
         )
         
         if uploaded_file is not None:
-            image = Image.open(uploaded_file)
-            st.session_state.uploaded_image = image
+            # Processed once per session; later reruns reuse the stored record
+            upload = get_session_upload(uploaded_file)
+            st.session_state.uploaded_image = upload
             with st.container():
                 st.markdown('<div class="image-container">', unsafe_allow_html=True)
-                st.image(image, caption=get_text('uploaded_image'), use_container_width=True)
+                st.image(upload["chat"], caption=get_text('uploaded_image'), use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
-            
-            # Save the image temporarily and store bytes
-            image.save("temp_uploaded_image.jpg")
-            
-            # Convert image to bytes for the agent
-            img_byte_arr = BytesIO()
-            image.save(img_byte_arr, format='JPEG')
-            image_bytes = img_byte_arr.getvalue()
-            st.session_state.current_image_bytes = image_bytes
-            
-            # Update global variable for the tool
-            update_current_image(image_bytes)
     
     else:  # Camera input
         camera_photo = st.camera_input(get_text('take_photo_btn'))
         
         if camera_photo is not None:
-            image = Image.open(camera_photo)
-            st.session_state.uploaded_image = image
+            # Processed once per session; later reruns reuse the stored record
+            upload = get_session_upload(camera_photo)
+            st.session_state.uploaded_image = upload
             with st.container():
                 st.markdown('<div class="image-container">', unsafe_allow_html=True)
-                st.image(image, caption=get_text('captured_image'), use_container_width=True)
+                st.image(upload["chat"], caption=get_text('captured_image'), use_container_width=True)
                 st.markdown('</div>', unsafe_allow_html=True)
-            
-            # Save the image temporarily and store bytes
-            image.save("temp_uploaded_image.jpg")
-            
-            # Convert image to bytes for the agent
-            img_byte_arr = BytesIO()
-            image.save(img_byte_arr, format='JPEG')
-            image_bytes = img_byte_arr.getvalue()
-            st.session_state.current_image_bytes = image_bytes
-            
-            # Update global variable for the tool
-            update_current_image(image_bytes)
     
     st.markdown('<div class="sidebar-divider"></div>', unsafe_allow_html=True)
     
@@ -1669,13 +1120,19 @@ with st.sidebar:
     if st.button(get_text('clear_chat'), use_container_width=True, type="secondary"):
         # Clear messages in current conversation
         if st.session_state.current_conversation_id in st.session_state.conversations:
-            st.session_state.conversations[st.session_state.current_conversation_id]['messages'] = []
+            st.session_state.conversations[st.session_state.current_conversation_id]['preview'] = None
+            st.session_state.conversations[st.session_state.current_conversation_id]['message_count'] = 0
             st.session_state.conversations[st.session_state.current_conversation_id]['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            save_conversations(st.session_state.conversations, st.session_state.user_id)
+            move_conversation_to_top(st.session_state.current_conversation_id)
+            clear_conversation_messages(st.session_state.user_id, st.session_state.current_conversation_id)
         
         st.session_state.messages = []
         st.session_state.uploaded_image = None
         st.session_state.generated_image = None
+        # Start the chat window over at one page
+        st.session_state.chat_window_conversation = None
+        # Drop the agent so the cleared history is not kept in its own conversation state
+        st.session_state.agent = None
         st.rerun()
     
     st.markdown('<div class="sidebar-divider"></div>', unsafe_allow_html=True)
@@ -1687,198 +1144,132 @@ with st.sidebar:
 # Main chat interface
 st.markdown(f"### {get_text('chat_title')}")
 
-# Display chat messages
-for message in st.session_state.messages:
+# Display chat messages: only the latest window, older pages are loaded on demand
+chat_page_size = get_chat_page_size()
+if st.session_state.get("chat_window_conversation") != st.session_state.current_conversation_id:
+    st.session_state.chat_window_conversation = st.session_state.current_conversation_id
+    st.session_state.chat_window = chat_page_size
+
+hidden_messages = max(len(st.session_state.messages) - st.session_state.chat_window, 0)
+if hidden_messages:
+    if st.button(f"{get_text('load_earlier_messages')} ({hidden_messages})", key="load_earlier_messages", use_container_width=True):
+        st.session_state.chat_window += chat_page_size
+        st.rerun()
+
+for message in st.session_state.messages[hidden_messages:]:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
         
-        # Display images if present
-        if "image" in message and message["image"]:
-            # Handle both base64 encoded images and image bytes
-            if isinstance(message["image"], str):
-                # Base64 encoded image from saved conversation
-                import base64
-                try:
-                    image_bytes = base64.b64decode(message["image"])
-                    # Validate image before displaying
-                    temp_image = Image.open(BytesIO(image_bytes))
-                    if temp_image.size[0] > 0 and temp_image.size[1] > 0:
-                        st.image(image_bytes, caption=get_text('generated_image'), use_container_width=True)
-                    else:
-                        st.error("Error: Invalid image dimensions in saved conversation")
-                except Exception as e:
-                    st.error(f"Error displaying saved image: {str(e)}")
-            elif isinstance(message["image"], bytes):
-                # Direct image bytes
-                try:
-                    # Validate image before displaying
-                    temp_image = Image.open(BytesIO(message["image"]))
-                    if temp_image.size[0] > 0 and temp_image.size[1] > 0:
-                        st.image(message["image"], caption=get_text('generated_image'), width=True)
-                    else:
-                        st.error("Error: Invalid image dimensions")
-                except Exception as e:
-                    st.error(f"Error displaying image: {str(e)}")
+        # Display images if present (messages only reference them by hash; validity was recorded at save time)
+        if message.get("image_hash"):
+            if not message.get("image_info", {}).get("valid"):
+                st.error("Error: Invalid image dimensions in saved conversation")
+            else:
+                image_bytes = load_image(message["image_hash"])
+                if image_bytes is None:
+                    st.error("Error: Image not found in saved conversation")
+                else:
+                    st.image(image_bytes, caption=get_text('generated_image'), use_container_width=True)
 
 # Chat input
 if prompt := st.chat_input(get_text('chat_placeholder')):
     # Add user message to chat
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    user_message = {"role": "user", "content": prompt}
+    st.session_state.messages.append(user_message)
     
     with st.chat_message("user"):
         st.markdown(prompt)
     
     # Generate response
     with st.chat_message("assistant"):
-        # Create placeholder for streaming response
+        # Create placeholders for tool progress and the streaming response
+        status_placeholder = st.empty()
         response_placeholder = st.empty()
         
-        try:
-            # Prepare the input for the agent
-            # Build a full conversation history so the agent has access to prior user and assistant messages
-            # Each entry can include text and, when available, image bytes (decoded from base64 or raw bytes)
-            history_input = []
-            for m in st.session_state.messages:
-                entry = {}
-                role = m.get("role", "user")
-                content = m.get("content", "")
-                if content:
-                    entry["text"] = str(content)
-                entry["role"] = role
-                # Include images from saved conversation entries if present
-                if "image" in m and m["image"]:
-                    image_bytes = None
-                    try:
-                        # If image was saved as base64 string in conversations, decode it
-                        if isinstance(m["image"], str):
-                            image_bytes = base64.b64decode(m["image"])
-                            # Validate image before including in history
-                            temp_image = Image.open(BytesIO(image_bytes))
-                            if temp_image.size[0] <= 0 or temp_image.size[1] <= 0:
-                                image_bytes = None
-                        elif isinstance(m["image"], (bytes, bytearray)):
-                            image_bytes = bytes(m["image"])
-                            # Validate image before including in history
-                            temp_image = Image.open(BytesIO(image_bytes))
-                            if temp_image.size[0] <= 0 or temp_image.size[1] <= 0:
-                                image_bytes = None
-                    except Exception:
-                        image_bytes = None
-
-                    if image_bytes:
-                        entry["image"] = {
-                            "format": "jpeg",
-                            "source": {"bytes": image_bytes},
-                        }
-
-                history_input.append(entry)
-
-            # Append the new user prompt as the latest message
-            history_input.append({"text": prompt, "role": "user"})
-
-            # Start agent_input with the assembled history
-            agent_input = history_input
-
-            # Also attach the currently uploaded image (if any) as an explicit image part
-            # This mirrors the previous behavior but now the agent will also receive past images from history
-            if st.session_state.uploaded_image is not None:
-                try:
-                    img_byte_arr = BytesIO()
-                    st.session_state.uploaded_image.save(img_byte_arr, format='JPEG')
-                    image_bytes = img_byte_arr.getvalue()
-                    
-                    # Validate uploaded image before sending to agent
-                    temp_image = Image.open(BytesIO(image_bytes))
-                    if temp_image.size[0] > 0 and temp_image.size[1] > 0:
-                        agent_input.append({
-                            "image": {
-                                "format": "jpeg",
-                                "source": {"bytes": image_bytes},
-                            },
-                        })
-                except Exception as e:
-                    print(f"Error processing uploaded image for agent: {e}")
-                    st.error(f"Error processing uploaded image: {str(e)}")
-            
-            # Show loading indicator
-            with response_placeholder:
-                st.markdown(f"_{get_text('thinking')}_")
-            
-            # Clear previous generated image flag and record timestamp
-            st.session_state.latest_generated_image = None
-            request_start_time = time.time()
-            
-            # Get response from agent (optimized)
-            agent_response = st.session_state.agent(agent_input)
-            
-            # Convert AgentResult to string if needed
-            if hasattr(agent_response, 'content'):
-                response = str(agent_response.content)
-            elif hasattr(agent_response, 'text'):
-                response = str(agent_response.text)
-            else:
-                response = str(agent_response)
-            
-            # Display response immediately
-            response_placeholder.markdown(response)
-            
-            # Check if a new image was generated and display it
-            # Try global variable first, then session state
-            generated_image_bytes = latest_generated_image_bytes or st.session_state.get('latest_generated_image', None)
-            
-            if generated_image_bytes and isinstance(generated_image_bytes, bytes):
-                try:
-                    # Validate image before displaying
-                    temp_image = Image.open(BytesIO(generated_image_bytes))
-                    if temp_image.size[0] > 0 and temp_image.size[1] > 0 and temp_image.format:
+        # Time the whole turn (agent, tools, database and image work) for tracing; spans are only
+        # collected for the latency panel when it is shown
+        with collect() if SHOW_LATENCY_PANEL else nullcontext() as turn_spans, span("turn"):
+            turn_saved = False
+            turn_completed = False
+            try:
+                agent = get_session_agent()
+                
+                # Show loading indicator
+                with response_placeholder:
+                    st.markdown(f"_{get_text('thinking')}_")
+                
+                def show_text(text):
+                    response_placeholder.markdown(text + "▌")
+                
+                def show_tool(name):
+                    # Status line while a tool runs (cleared with None once the answer continues)
+                    status_key = TOOL_STATUS_KEYS.get(name)
+                    if status_key:
+                        status_placeholder.caption(get_text(status_key))
+                    else:
+                        status_placeholder.empty()
+                
+                # Run the agent and save the turn; only the new turn is persisted, earlier messages are already stored
+                conversation_id = st.session_state.current_conversation_id
+                message_to_save, generated_image_bytes = run_turn(
+                    agent,
+                    st.session_state.user_id,
+                    conversation_id if conversation_id in st.session_state.conversations else None,
+                    st.session_state.messages[:-1],
+                    prompt,
+                    uploaded_image=st.session_state.uploaded_image,
+                    memory_prefetch=st.session_state.pop("memory_prefetch", None),
+                    on_text=show_text,
+                    on_tool=show_tool,
+                )
+                st.session_state.messages.append(message_to_save)
+                turn_saved = True
+                
+                # Display the complete response
+                response_placeholder.markdown(message_to_save["content"])
+                
+                # Display the image generated in this turn, if any (validated when it was saved)
+                if generated_image_bytes is not None:
+                    if message_to_save["image_info"]["valid"]:
                         print(f"Displaying generated image: {len(generated_image_bytes)} bytes")
                         st.image(generated_image_bytes, caption=get_text('generated_image'), use_container_width=True)
                     else:
                         print("Generated image has invalid dimensions or format")
                         st.error("Error: Generated image has invalid dimensions or format")
-                except Exception as e:
-                    print(f"Error displaying generated image: {e}")
-                    st.error(f"Error displaying generated image: {str(e)}")
-            else:
-                print(f"No image to display. Global: {latest_generated_image_bytes is not None}, Session: {st.session_state.get('latest_generated_image', None) is not None}")
-            
-            # Add assistant message to chat (ensure serializable)
-            message_to_save = {
-                "role": "assistant",
-                "content": response,
-                "image": generated_image_bytes if generated_image_bytes and isinstance(generated_image_bytes, bytes) else None
-            }
-            st.session_state.messages.append(message_to_save)
-            
-            # Save conversation with serializable data only
-            if st.session_state.current_conversation_id in st.session_state.conversations:
-                # Create a clean copy of messages for JSON serialization
-                serializable_messages = []
-                for msg in st.session_state.messages:
-                    clean_msg = {
-                        "role": msg.get("role", "user"),
-                        "content": str(msg.get("content", "")),
-                    }
-                    if "image" in msg and msg["image"]:
-                        # Convert image bytes to base64 for JSON serialization
-                        if isinstance(msg["image"], bytes):
-                            import base64
-                            clean_msg["image"] = base64.b64encode(msg["image"]).decode('utf-8')
-                        else:
-                            clean_msg["image"] = str(msg["image"])
-                    serializable_messages.append(clean_msg)
+                else:
+                    print("No image to display")
+                
+                if st.session_state.current_conversation_id in st.session_state.conversations:
+                    if not st.session_state.conversations[st.session_state.current_conversation_id].get('preview'):
+                        st.session_state.conversations[st.session_state.current_conversation_id]['preview'] = format_preview(prompt)
+                    st.session_state.conversations[st.session_state.current_conversation_id]['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M")
+                    st.session_state.conversations[st.session_state.current_conversation_id]['message_count'] = (
+                        st.session_state.conversations[st.session_state.current_conversation_id].get('message_count', 0) + 2
+                    )
+                    move_conversation_to_top(st.session_state.current_conversation_id)
+                turn_completed = True
                 
-                st.session_state.conversations[st.session_state.current_conversation_id]['messages'] = serializable_messages
-                st.session_state.conversations[st.session_state.current_conversation_id]['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M")
-                save_conversations(st.session_state.conversations, st.session_state.user_id)
-            
-        except Exception as e:
-            error_message = f"{get_text('error')} {str(e)}"
-            response_placeholder.error(error_message)
-            st.session_state.messages.append({
-                "role": "assistant",
-                "content": error_message
-            })
+            except Exception as e:
+                error_message = f"{get_text('error')} {str(e)}"
+                response_placeholder.error(error_message)
+                # The error stays on screen but is not saved, so it is never replayed
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": error_message,
+                    "unsaved": True
+                })
+            finally:
+                # Also reached when the turn is interrupted (a widget click during streaming raises
+                # Streamlit's RerunException, which is not an Exception)
+                if not turn_completed:
+                    # The agent may hold the prompt without a reply: rebuild it from the saved history
+                    st.session_state.agent = None
+                    # An unsaved prompt stays on screen but is never replayed
+                    if not turn_saved:
+                        user_message["unsaved"] = True
+
+        if SHOW_LATENCY_PANEL:
+            show_latency_panel(turn_spans)
 
 # Footer
 st.markdown(f"""
@@ -0,0 +1,50 @@
+"""Micro-benchmark: country index lookup vs. building a CountryInfo per call (as user_country used to).
+
+Run from the repository root:
+    python benchmarks/country_lookup.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from countryinfo import CountryInfo
+
+from countries import lookup_country
+
+NAMES = ["France", "Italy", "Spain", "Germany", "Japan", "Brazil", "Nigeria", "United States"]
+LOCALIZED_NAMES = ["Italie", "España", "Deutschland", "Japon", "Brasil", "USA", "UK", "Allemagne"]
+ROUNDS = 2000
+
+def country_info_lookup(name):
+    """The previous user_country body: construct CountryInfo and call eight accessors"""
+    country = CountryInfo(name)
+    return {
+        'capital': country.capital(),
+        'currencies': country.currencies(),
+        'languages': country.languages(),
+        'borders': country.borders(),
+        'area': country.area(),
+        'calling_codes': country.calling_codes(),
+        'timezones': country.timezones(),
+        'population': country.population()
+    }
+
+def per_call_us(fn, names, rounds):
+    """Average microseconds per lookup of fn over all names"""
+    seconds = timeit.timeit(lambda: [fn(name) for name in names], number=rounds)
+    return seconds / (rounds * len(names)) * 1e6
+
+def main():
+    country_info_us = per_call_us(country_info_lookup, NAMES, ROUNDS // 10)
+    index_us = per_call_us(lookup_country, NAMES, ROUNDS)
+    localized_us = per_call_us(lookup_country, LOCALIZED_NAMES, ROUNDS)
+    localized_hits = sum(lookup_country(name) is not None for name in LOCALIZED_NAMES)
+
+    print(f"CountryInfo per call:       {country_info_us:9.2f} us/lookup")
+    print(f"Country index:              {index_us:9.2f} us/lookup ({country_info_us / index_us:.0f}x faster)")
+    print(f"Country index (localized):  {localized_us:9.2f} us/lookup, {localized_hits}/{len(LOCALIZED_NAMES)} found")
+
+if __name__ == "__main__":
+    main()
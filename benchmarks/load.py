@@ -0,0 +1,387 @@
+"""Concurrent-session load harness for StyleGenie.
+
+Runs many simulated user sessions at once against one shared SQLite
+database, with external services replaced by the fakes (PROVIDER_MODE=fake),
+whose latencies can be tuned with --fake-config. Two drivers:
+
+- "direct" (default): every session is a thread of this process running
+  the app's chat turns (chat.run_turn) without the Streamlit UI, so
+  sessions share the I/O loop, tool pools, connection pool, caches and
+  memory writer the way they do inside one Streamlit server. This scales
+  to hundreds of sessions.
+- "apptest": every session runs app.py headless through Streamlit's
+  AppTest. AppTest swaps process-wide Streamlit state on every run, so each
+  session gets its own worker process (like app replicas sharing data.db).
+
+Every session uploads an image, chats, starts new conversations, switches
+back to older ones and deletes some. The report covers throughput,
+turn latency percentiles, SQLite write-lock wait time and peak RSS.
+
+Run from the repository root:
+    python benchmarks/load.py --sessions 200 --turns 12 --output load_results.json
+    python benchmarks/load.py --driver apptest --sessions 10 --turns 12
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from collections import defaultdict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("PROVIDER_MODE", "fake")
+
+from strands.handlers.callback_handler import null_callback_handler
+from streamlit.testing.v1 import AppTest
+
+import database
+import tracing
+from images import ingest_image
+from suite import WORDS, make_image, summarize
+
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# Messages a session sends, picked at random; the fake chat model maps their keywords to tools
+PROMPTS = [
+    "What should I wear to a summer wedding?",
+    "Find me a linen shirt under $50",
+    "Change the jacket to white leather",
+    "I love navy and beige colours",
+    "Where can I buy white sneakers?",
+    "Make it more casual",
+]
+
+class CollectingSink:
+    """Tracing sink keeping the duration of every finished span, by span name"""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        with self._lock:
+            self.durations[span.name].append(span.duration_ms / 1000)
+
+class Session:
+    """One simulated user: the sequence of actions, with their latencies and errors"""
+
+    def __init__(self, index, args):
+        self.index = index
+        self.args = args
+        self.rng = random.Random(index)
+        self.timings = defaultdict(list)
+        self.errors = []
+        self.turns = 0
+
+    def step(self, name, action):
+        """Run one user action; record its latency and any error"""
+        start = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            self.errors.append({"session": self.index, "step": name, "error": f"{type(e).__name__}: {e}"})
+            return False
+        finally:
+            self.timings[name].append(time.perf_counter() - start)
+        return True
+
+    def next_image(self):
+        return make_image(self.args.image_size, self.args.image_size, self.index * 1000 + self.turns)
+
+    def next_prompt(self):
+        return self.rng.choice(PROMPTS) + " " + " ".join(self.rng.choice(WORDS) for _ in range(self.rng.randint(0, 12)))
+
+    def chat(self):
+        prompt = self.next_prompt()
+        if self.step("turn", lambda: self.send(prompt)):
+            self.turns += 1
+
+    def run(self):
+        self.step("upload", self.upload)
+        for turn in range(self.args.turns):
+            time.sleep(self.rng.uniform(0, self.args.think_time))
+            self.chat()
+            if turn % self.args.turns_per_conversation == self.args.turns_per_conversation - 1:
+                self.step("new_chat", self.new_chat)
+                if self.rng.random() < 0.5:
+                    self.step("switch", self.switch)
+                if self.rng.random() < self.args.delete_rate:
+                    self.step("delete", self.delete)
+                self.step("upload", self.upload)
+
+class DirectSession(Session):
+    """Session running the app's chat turns in this process, the way app.py does for one browser session"""
+
+    def __init__(self, index, args):
+        super().__init__(index, args)
+        # Imported once database.DB_PATH points at the load database: the memory store opens it at import time
+        global memory, run_turn, style_genie_agent
+        import memory
+        import style_genie_agent
+        from chat import run_turn
+
+        self.user_id = str(uuid.uuid4())
+        self.conversation_ids = []  # Most recent first
+        self.uploaded_image = None
+
+    def open(self):
+        def action():
+            tracing.set_tags(session_id=self.user_id)
+            database.ensure_user_exists(self.user_id)
+            self.new_chat()
+        return self.step("open", action)
+
+    def start_agent(self, conversation_id, messages):
+        # The app rebuilds the agent and prefetches memories whenever the conversation changes
+        self.conversation_id = conversation_id
+        self.messages = messages
+        self.agent = style_genie_agent.initialize_agent(self.user_id)
+        self.agent.callback_handler = null_callback_handler  # Hundreds of sessions printing their replies is just noise
+        self.memory_prefetch = memory.prefetch_memories(self.user_id)
+        tracing.set_tags(conversation_id=conversation_id)
+
+    def new_chat(self):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M")
+        conversation = {"id": str(uuid.uuid4()), "title": f"Conversation - {timestamp}", "created_at": timestamp, "updated_at": timestamp}
+        database.insert_conversation(self.user_id, conversation)
+        self.conversation_ids.insert(0, conversation["id"])
+        self.uploaded_image = None
+        self.start_agent(conversation["id"], [])
+
+    def switch(self):
+        others = [conv_id for conv_id in self.conversation_ids if conv_id != self.conversation_id]
+        if others:
+            conv_id = self.rng.choice(others)
+            self.start_agent(conv_id, database.load_conversation_messages(conv_id))
+
+    def delete(self):
+        # Delete the oldest conversation that is not the current one
+        others = [conv_id for conv_id in self.conversation_ids if conv_id != self.conversation_id]
+        if len(others) > 1:
+            database.delete_conversation(self.user_id, others[-1])
+            self.conversation_ids.remove(others[-1])
+
+    def upload(self):
+        self.uploaded_image = ingest_image(self.next_image())
+
+    def send(self, prompt):
+        with tracing.span("turn"):
+            memory_prefetch, self.memory_prefetch = self.memory_prefetch, None
+            try:
+                reply, _ = run_turn(
+                    self.agent, self.user_id, self.conversation_id, self.messages, prompt,
+                    uploaded_image=self.uploaded_image, memory_prefetch=memory_prefetch,
+                )
+            except Exception:
+                # Like the app: the agent may hold the prompt without a reply, so it is rebuilt from the saved history
+                self.start_agent(self.conversation_id, self.messages)
+                raise
+            self.messages.extend([{"role": "user", "content": prompt}, reply])
+
+class AppTestSession(Session):
+    """Session driving app.py through AppTest"""
+
+    def __init__(self, index, args):
+        super().__init__(index, args)
+        self.at = AppTest.from_file(APP_PATH, default_timeout=args.timeout)
+
+    def rerun(self, widget=None):
+        """Rerun the app (after clicking or filling a widget) and raise the app's exception, if any"""
+        (widget or self.at).run()
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def sidebar_buttons(self, prefix):
+        return [button for button in self.at.sidebar.button if (button.key or "").startswith(prefix)]
+
+    def open(self):
+        return self.step("open", self.rerun)
+
+    def upload(self):
+        # AppTest cannot drive st.file_uploader, so the upload record is built the way get_session_upload does
+        self.at.session_state.uploaded_image = ingest_image(self.next_image())
+        self.rerun()
+
+    def send(self, prompt):
+        self.rerun(self.at.chat_input[0].set_value(prompt))
+
+    def new_chat(self):
+        # The new chat button is the first button of the sidebar (it has no key)
+        self.rerun(self.at.sidebar.button[0].click())
+
+    def switch(self):
+        candidates = [button for button in self.sidebar_buttons("conv_") if not button.disabled]
+        if candidates:
+            self.rerun(self.rng.choice(candidates).click())
+
+    def delete(self):
+        # Delete the oldest conversation that is not the current one
+        candidates = [
+            button for button, conv in zip(self.sidebar_buttons("del_"), self.sidebar_buttons("conv_"))
+            if not conv.disabled
+        ]
+        if len(candidates) > 1:
+            self.rerun(candidates[-1].click())
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_session(session_class, index, args, start_at):
+    """Open a session, wait for the common start, run it and return its timings and errors"""
+    # The first run (cold start of the app for AppTest) happens before the clock starts
+    session = session_class(index, args)
+    opened = session.open()
+
+    # Sessions then start together, staggered over the ramp-up period
+    time.sleep(max(0.0, start_at - time.time()) + args.ramp_up * index / max(1, args.sessions))
+    started = time.time()
+    try:
+        if opened:
+            session.run()
+    except Exception:
+        session.errors.append({"session": index, "step": "session", "error": traceback.format_exc(limit=3)})
+    return {
+        "turns": session.turns,
+        "started": started,
+        "finished": time.time(),
+        "timings": dict(session.timings),
+        "errors": session.errors,
+    }
+
+def run_apptest_session(index, args, db_path, start_at):
+    """Worker process: run one AppTest session and return its results, spans and peak RSS"""
+    database.DB_PATH = db_path
+    sink = CollectingSink()
+    tracing.add_sink(sink)
+    result = run_session(AppTestSession, index, args, start_at)
+    result["spans"] = dict(sink.durations)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def run(args):
+    if args.fake_config:
+        os.environ["FAKE_PROVIDER_CONFIG"] = args.fake_config
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.abspath(args.db or os.path.join(workdir, "load.db"))
+        database.DB_PATH = db_path
+        database.init_db()
+
+        if args.driver == "apptest":
+            # Spawned workers import and open the app from scratch; give them time to do so before the clock starts
+            start_at = time.time() + args.startup
+            with ProcessPoolExecutor(max_workers=args.sessions, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = [executor.submit(run_apptest_session, index, args, db_path, start_at) for index in range(args.sessions)]
+                sessions = [future.result() for future in futures]
+            span_durations = [result["spans"] for result in sessions]
+            peak_rss = [result["peak_rss_mb"] for result in sessions]
+        else:
+            sink = CollectingSink()
+            tracing.add_sink(sink)
+            start_at = time.time() + min(args.startup, 5.0)
+            with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="load-session") as executor:
+                futures = [executor.submit(run_session, DirectSession, index, args, start_at) for index in range(args.sessions)]
+                sessions = [future.result() for future in futures]
+            span_durations = [sink.durations]
+            peak_rss = [peak_rss_mb()]
+
+    timings = defaultdict(list)
+    spans = defaultdict(list)
+    errors = []
+    for result in sessions:
+        for name, durations in result["timings"].items():
+            timings[name].extend(durations)
+        errors.extend(result["errors"])
+    for durations_by_name in span_durations:
+        for name, durations in durations_by_name.items():
+            spans[name].extend(durations)
+
+    turns = sum(result["turns"] for result in sessions)
+    elapsed = max(result["finished"] for result in sessions) - min(result["started"] for result in sessions)
+    lock_waits = spans.get("db.lock_wait", [])
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "driver": args.driver,
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "turns_per_conversation": args.turns_per_conversation,
+            "think_time": args.think_time,
+            "image_size": args.image_size,
+            "provider_mode": os.environ.get("PROVIDER_MODE"),
+            "fake_config": os.environ.get("FAKE_PROVIDER_CONFIG"),
+        },
+        "summary": {
+            "elapsed_s": elapsed,
+            "turns_completed": turns,
+            "throughput_turns_per_s": turns / elapsed if elapsed else 0.0,
+            "errors": len(errors),
+            "lock_wait_total_s": sum(lock_waits),
+            "lock_wait_count": len(lock_waits),
+            "processes": len(peak_rss),
+            "peak_rss_mb": max(peak_rss),
+            "peak_rss_total_mb": sum(peak_rss),
+        },
+        "steps": {name: summarize(durations) for name, durations in sorted(timings.items()) if durations},
+        "spans": {name: summarize(durations) for name, durations in sorted(spans.items()) if durations},
+        "errors": errors[:50],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--driver", choices=("direct", "apptest"), default="direct", help="session driver (see above)")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("--turns", type=int, default=10, help="chat turns per session")
+    parser.add_argument("--turns-per-conversation", type=int, default=4, help="turns before starting a new conversation")
+    parser.add_argument("--delete-rate", type=float, default=0.5, help="chance of deleting an old conversation after starting a new one")
+    parser.add_argument("--think-time", type=float, default=0.5, help="maximum pause in seconds before each turn")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="seconds over which sessions start")
+    parser.add_argument("--image-size", type=int, default=1024, help="edge length in pixels of uploaded images")
+    parser.add_argument("--startup", type=float, default=30.0, help="seconds allowed for the sessions to open before they start (apptest: the worker processes; direct: at most 5)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed for one rerun")
+    parser.add_argument("--db", help="shared database file (default: a throwaway one)")
+    parser.add_argument("--fake-config", help="FAKE_PROVIDER_CONFIG for the fake services (JSON string or file)")
+    parser.add_argument("--output", default="load_results.json", help="JSON results file")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    summary = report["summary"]
+    print(f"{summary['turns_completed']} turns in {summary['elapsed_s']:.1f} s "
+          f"({summary['throughput_turns_per_s']:.2f} turns/s), {summary['errors']} errors")
+    print(f"SQLite lock wait: {summary['lock_wait_total_s'] * 1000:.1f} ms over {summary['lock_wait_count']} write transactions")
+    if summary["processes"] > 1:
+        print(f"Peak RSS: {summary['peak_rss_mb']:.0f} MB per session process, {summary['peak_rss_total_mb']:.0f} MB in total")
+    else:
+        print(f"Peak RSS: {summary['peak_rss_mb']:.0f} MB")
+    for section in ("steps", "spans"):
+        for name, stats in report[section].items():
+            print(f"{section[:-1]:5s} {name:32s} n={stats['n']:<5d} p50={stats['p50_ms']:9.1f} ms  "
+                  f"p95={stats['p95_ms']:9.1f} ms  p99={stats['p99_ms']:9.1f} ms")
+    for error in report["errors"][:5]:
+        print(f"error: session {error['session']} {error['step']}: {error['error']}")
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
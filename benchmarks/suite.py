@@ -0,0 +1,226 @@
+"""Offline benchmark suite for StyleGenie's persistence, history and image paths.
+
+Generates synthetic users in a throwaway SQLite database and times the hot
+paths of a session. No network is used: the agent turn runs on a stub model
+with a stub tool. Results are printed and written as JSON.
+
+Run from the repository root:
+    python benchmarks/suite.py --users 5 --conversations 50 --messages 40 --output bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+from strands import Agent, tool
+from strands.models import Model
+
+import database
+from database import first_user_preview
+from history import build_history_input
+from images import describe_image, ingest_image
+
+class StubModel(Model):
+    """Model that answers instantly: one web_search call on a new prompt, then a short text reply"""
+
+    def __init__(self):
+        self.config = {}
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        yield {"output": output_model.model_construct()}
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        yield {"messageStart": {"role": "assistant"}}
+        last = messages[-1]
+        answered_tool = any("toolResult" in block for block in last["content"])
+        if tool_specs and not answered_tool:
+            yield {"contentBlockStart": {"start": {"toolUse": {"name": "web_search", "toolUseId": "bench"}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps({"search": "linen shirt"})}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+            return
+        for word in ("Here ", "are ", "some ", "ideas."):
+            yield {"contentBlockDelta": {"delta": {"text": word}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+
+@tool
+def web_search(search: str) -> dict:
+    """Stub web search returning canned results"""
+    return {
+        "results": [
+            {"title": f"Result {i}", "url": f"https://example.com/{i}", "content": search, "score": 0}
+            for i in range(5)
+        ],
+        "total_results": 5,
+    }
+
+# Vocabulary for synthetic messages
+WORDS = (
+    "linen shirt navy blazer sneakers boots budget summer wedding outfit colour palette trousers "
+    "dress casual formal beige oversized slim fit jacket scarf autumn layering denim wool"
+).split()
+
+def make_image(width, height, seed):
+    """Return a noisy RGB JPEG of the given size (noise keeps the encoder honest)"""
+    image = Image.frombytes("RGB", (width, height), random.Random(seed).randbytes(width * height * 3))
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+def make_user(user_index, conversations, messages, image_every, image_size):
+    """Build one synthetic user's conversations: {conversation_id: {..., 'messages': [...]}}"""
+    rng = random.Random(user_index)
+    user_conversations = {}
+    for conv_index in range(conversations):
+        conv_id = f"bench-{user_index}-{conv_index}"
+        conv_messages = []
+        for msg_index in range(messages):
+            role = "user" if msg_index % 2 == 0 else "assistant"
+            words = rng.randint(8, 80)
+            message = {"role": role, "content": " ".join(rng.choice(WORDS) for _ in range(words))}
+            if image_every and role == "assistant" and msg_index % image_every == image_every - 1:
+                image_bytes = make_image(image_size, image_size, hash((user_index, conv_index, msg_index)))
+                message["image_hash"] = database.store_image(image_bytes)
+            conv_messages.append(message)
+        timestamp = f"2025-01-{1 + conv_index % 28:02d} {conv_index % 24:02d}:00"
+        user_conversations[conv_id] = {
+            "id": conv_id,
+            "title": f"Conversation {conv_index}",
+            "created_at": timestamp,
+            "updated_at": timestamp,
+            "messages": conv_messages,
+        }
+    return user_conversations
+
+def timed(results, name, fn, *args, **kwargs):
+    """Call fn once, record its duration under name, and return its result"""
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    results.setdefault(name, []).append(time.perf_counter() - start)
+    return value
+
+def summarize(durations):
+    """Return count and latency statistics (milliseconds) for a list of durations in seconds"""
+    values = sorted(d * 1000 for d in durations)
+    def percentile(p):
+        return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return {
+        "n": len(values),
+        "mean_ms": statistics.fmean(values),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "min_ms": values[0],
+        "max_ms": values[-1],
+    }
+
+def run(args):
+    results = {}
+    random.seed(0)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.DB_PATH = os.path.join(workdir, "bench.db")
+        database.init_db()
+
+        users = {}
+        for user_index in range(args.users):
+            user_id = f"bench-user-{user_index}"
+            users[user_id] = make_user(user_index, args.conversations, args.messages, args.image_every, args.image_size)
+            timed(results, "save_conversations.initial", database.save_conversations, users[user_id], user_id)
+
+        agent = Agent(model=StubModel(), tools=[web_search], callback_handler=None)
+
+        for _ in range(args.repeat):
+            for user_id, conversations in users.items():
+                page = timed(results, "load_conversations", database.load_conversations, user_id)
+                timed(results, "count_conversations", database.count_conversations, user_id)
+
+                conv_id = next(iter(page))
+                messages = timed(results, "load_conversation_messages", database.load_conversation_messages, conv_id)
+                timed(results, "conversation_preview", first_user_preview, messages)
+
+                # Cold image cache, as on the first turn after opening a conversation
+                database.clear_image_cache()
+                timed(results, "build_history_input.window20", build_history_input, messages, 20)
+                database.clear_image_cache()
+                timed(results, "build_history_input.full", build_history_input, messages, None)
+
+                # One more turn, synced the way a full save would do it
+                conversations[conv_id]["messages"].append({"role": "user", "content": "What about shoes?"})
+                conversations[conv_id]["messages"].append({"role": "assistant", "content": "Try white sneakers."})
+                timed(results, "save_conversations.incremental", database.save_conversations, conversations, user_id)
+                timed(results, "append_messages", database.append_messages, user_id, conv_id, [
+                    {"role": "user", "content": "And a bag?"},
+                    {"role": "assistant", "content": "A tan leather tote."},
+                ])
+                conversations[conv_id]["messages"].extend([
+                    {"role": "user", "content": "And a bag?"},
+                    {"role": "assistant", "content": "A tan leather tote."},
+                ])
+
+                agent.messages = []
+                history = build_history_input(messages, 20)
+                history.append({"text": "Find me a linen shirt", "role": "user"})
+                timed(results, "agent_turn.stub", agent, history)
+
+            image_bytes = make_image(args.image_size, args.image_size, random.random())
+            timed(results, "image.ingest", ingest_image, image_bytes)
+            timed(results, "image.describe", describe_image, image_bytes)
+            image_hash = timed(results, "image.store", database.store_image, image_bytes)
+            database.clear_image_cache()
+            timed(results, "image.load.uncached", database.load_image, image_hash)
+            timed(results, "image.load.cached", database.load_image, image_hash)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": args.users,
+            "conversations": args.conversations,
+            "messages": args.messages,
+            "image_every": args.image_every,
+            "image_size": args.image_size,
+            "repeat": args.repeat,
+        },
+        "results": {name: summarize(durations) for name, durations in sorted(results.items())},
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=3, help="synthetic users")
+    parser.add_argument("--conversations", type=int, default=30, help="conversations per user")
+    parser.add_argument("--messages", type=int, default=40, help="messages per conversation")
+    parser.add_argument("--image-every", type=int, default=10, help="attach an image to every Nth message (0: none)")
+    parser.add_argument("--image-size", type=int, default=1024, help="edge length in pixels of generated images")
+    parser.add_argument("--repeat", type=int, default=20, help="timed rounds per user")
+    parser.add_argument("--output", default="bench_results.json", help="JSON results file")
+    args = parser.parse_args()
+
+    report = run(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in report["results"].items():
+        print(f"{name:34s} n={stats['n']:<5d} p50={stats['p50_ms']:9.3f} ms  p95={stats['p95_ms']:9.3f} ms")
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""One StyleGenie chat turn: the agent input, the agent call and saving the turn.
+
+app.py runs run_turn for every Streamlit session and benchmarks/load.py's
+direct driver for every simulated one, so both go through the same code.
+The caller owns the session (its agent and the messages on screen) and
+renders progress through the on_text and on_tool callbacks.
+"""
+import asyncio
+
+from database import append_messages, image_info, store_image, transaction
+from history import build_history_input
+from images import describe_image
+from memory import prefetched_memories
+from style_genie_agent import memory_snapshot_input, new_turn_images
+from tracing import span
+
+# Stream the agent's answer as it is generated (False: wait for the complete answer)
+STREAM_RESPONSES = True
+
+# How the conversation reaches the agent on each turn:
+# "incremental" - the session's agent keeps its own history, so only the new prompt (and a newly attached image)
+#                 is sent; the saved history is replayed only when the agent starts empty (e.g. after a rebuild)
+# "replay"      - the saved history is replayed to an empty agent history on every turn
+AGENT_HISTORY_MODE = "incremental"
+AGENT_HISTORY_WINDOW = 20  # Most recent saved messages included when replaying (None for all of them)
+
+def build_agent_input(agent, history, prompt, user_id, uploaded_image=None, memory_prefetch=None):
+    """Return the agent input for a new prompt.
+
+    history is the conversation before the prompt. It is replayed when the
+    agent's own history is empty (or on every turn in "replay" mode), along
+    with the memories loaded by memory_prefetch, if given. The uploaded image
+    record (see images.ingest_image) is attached unless the agent already
+    received this exact image.
+    """
+    if AGENT_HISTORY_MODE == "replay" or not agent.messages:
+        # Fresh agent history: send the saved conversation (windowed) followed by the new prompt
+        agent.messages = []
+        agent.state.delete("sent_image_hash")
+        agent_input = build_history_input(history, AGENT_HISTORY_WINDOW)
+
+        # First turn of this agent: hand it the prefetched memories so it can skip the get_all_memories round-trip
+        if memory_prefetch is not None:
+            with span("memory.prefetch_wait"):
+                snapshot = prefetched_memories(memory_prefetch)
+            if snapshot is not None:
+                agent_input.append(memory_snapshot_input(user_id, snapshot))
+    else:
+        # The agent already holds this conversation: only the new turn is sent
+        agent_input = []
+    agent_input.append({"text": prompt, "role": "user"})
+
+    # The upload was decoded, validated and normalized (oriented, downscaled JPEG) once when it was ingested
+    if uploaded_image is not None and agent.state.get("sent_image_hash") != uploaded_image["hash"]:
+        agent_input.append({
+            "image": {
+                "format": "jpeg",
+                "source": {"bytes": uploaded_image["chat"]},
+            },
+        })
+        agent.state.set("sent_image_hash", uploaded_image["hash"])
+    return agent_input
+
+async def stream_agent(agent, agent_input, invocation_state, on_text=None, on_tool=None):
+    """Run the agent on its async event stream and return the full response text.
+
+    on_text(text so far) is called for every text delta and on_tool(name)
+    once per tool call; on_tool(None) follows when the tools are done, i.e.
+    text resumes or the stream ends (also when it raises).
+    """
+    response_text = ""
+    result = None
+    announced_tools = set()
+    tool_running = False
+
+    try:
+        async for event in agent.stream_async(agent_input, invocation_state=invocation_state):
+            if "data" in event:
+                if tool_running and on_tool is not None:
+                    on_tool(None)
+                tool_running = False
+                response_text += event["data"]
+                if on_text is not None:
+                    on_text(response_text)
+            elif "current_tool_use" in event:
+                tool_use = event["current_tool_use"]
+                tool_use_id = tool_use.get("toolUseId")
+                if tool_use_id and tool_use_id not in announced_tools:
+                    announced_tools.add(tool_use_id)
+                    tool_running = True
+                    if on_tool is not None:
+                        on_tool(tool_use.get("name"))
+                    # Keep text from before and after the tool call in separate paragraphs
+                    if response_text and not response_text.endswith("\n\n"):
+                        response_text += "\n\n"
+            elif "result" in event:
+                result = event["result"]
+    finally:
+        if tool_running and on_tool is not None:
+            on_tool(None)
+
+    if not response_text.strip() and result is not None:
+        response_text = str(result)
+    return response_text
+
+def run_agent(agent, agent_input, invocation_state, on_text=None, on_tool=None):
+    """Run the agent on one turn's input and return the response text (streamed when STREAM_RESPONSES is set)"""
+    with span("agent", streaming=STREAM_RESPONSES):
+        if STREAM_RESPONSES:
+            return asyncio.run(stream_agent(agent, agent_input, invocation_state, on_text, on_tool))
+
+        agent_response = agent(agent_input, invocation_state=invocation_state)
+
+        # Convert AgentResult to string if needed
+        if hasattr(agent_response, 'content'):
+            return str(agent_response.content)
+        if hasattr(agent_response, 'text'):
+            return str(agent_response.text)
+        return str(agent_response)
+
+def save_turn(user_id, conversation_id, prompt, response, generated_image=None):
+    """Save a turn's prompt and reply and return the reply message.
+
+    A generated image goes to the image store and the reply keeps its hash
+    and image_info (validated once here and reused on every redraw). The
+    messages are appended to conversation_id unless it is None.
+    """
+    reply = {"role": "assistant", "content": response}
+    info = (describe_image(generated_image) or {}) if generated_image is not None else None
+
+    # The image and the messages referencing it are written in one transaction, so another
+    # session's orphan-image cleanup (delete or clear chat) cannot remove the image in between
+    with transaction():
+        if generated_image is not None:
+            reply["image_hash"] = store_image(generated_image, 'image/png', info)
+            reply["image_info"] = image_info(info.get("width"), info.get("height"), info.get("format"))
+
+        # Persist only this turn (user prompt + assistant reply); earlier messages are already stored
+        if conversation_id is not None:
+            append_messages(user_id, conversation_id, [{"role": "user", "content": prompt}, reply])
+    return reply
+
+def run_turn(agent, user_id, conversation_id, history, prompt, uploaded_image=None, memory_prefetch=None,
+             on_text=None, on_tool=None):
+    """Answer a prompt with the agent and save the turn (see build_agent_input, run_agent and save_turn).
+
+    Returns (reply message, bytes of the image generated in the turn or None).
+    Nothing is saved if the agent fails; the agent may then hold the prompt
+    without a reply, so the caller should rebuild it from the saved history.
+    """
+    agent_input = build_agent_input(agent, history, prompt, user_id, uploaded_image, memory_prefetch)
+
+    # The tools edit the downscaled upload and report generated images back through the invocation state
+    turn_images = new_turn_images(uploaded_image["edit"] if uploaded_image is not None else None)
+    response = run_agent(agent, agent_input, {"turn_images": turn_images}, on_text, on_tool)
+
+    generated_image = turn_images["generated_images"][-1] if turn_images["generated_images"] else None
+    if not isinstance(generated_image, bytes):
+        generated_image = None
+    return save_turn(user_id, conversation_id, prompt, response, generated_image), generated_image
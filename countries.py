@@ -0,0 +1,90 @@
+"""Country lookup for StyleGenie: the countryinfo dataset indexed once per process by name, code and translation."""
+import re
+import unicodedata
+from functools import lru_cache
+
+from countryinfo import all_countries
+
+# Common names that are not in the dataset's own spellings, mapped to the dataset's country name
+COUNTRY_ALIASES = {
+    "usa": "United States",
+    "us": "United States",
+    "america": "United States",
+    "etats unis": "United States",
+    "estados unidos": "United States",
+    "vereinigte staaten": "United States",
+    "uk": "United Kingdom",
+    "great britain": "United Kingdom",
+    "britain": "United Kingdom",
+    "england": "United Kingdom",
+    "scotland": "United Kingdom",
+    "wales": "United Kingdom",
+    "angleterre": "United Kingdom",
+    "inglaterra": "United Kingdom",
+    "holland": "Netherlands",
+    "hollande": "Netherlands",
+    "holanda": "Netherlands",
+    "korea": "South Korea",
+    "coree du sud": "South Korea",
+    "corea del sur": "South Korea",
+    "russie": "Russia",
+    "rusia": "Russia",
+}
+
+def normalize_country_name(name):
+    """Normalize a country name for lookups: case, accents, punctuation and whitespace"""
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(char for char in name if not unicodedata.combining(char)).casefold()
+    return re.sub(r"[\W_]+", " ", name).strip()
+
+def country_record(info):
+    """Trim a countryinfo record to what the assistant needs for shopping advice"""
+    return {
+        "name": info.get("name"),
+        "capital": info.get("capital"),
+        "region": info.get("region"),
+        "currencies": info.get("currencies", []),
+        "languages": info.get("languages", []),
+        "timezones": info.get("timezones", []),
+    }
+
+def build_country_index():
+    """Build {normalized name: trimmed record} from the countryinfo dataset.
+
+    Keys are added in order of precedence (English name and ISO codes, then
+    native names and alternative spellings, then translations, then
+    COUNTRY_ALIASES) and an earlier key is never overwritten, so an ambiguous
+    spelling resolves to the country for which it is the most official name.
+    """
+    infos = [country.info() for country in all_countries()]
+    records = [country_record(info) for info in infos]
+
+    index = {}
+    def add_keys(names, record):
+        for name in names:
+            key = normalize_country_name(name) if name else ""
+            if key:
+                index.setdefault(key, record)
+
+    for info, record in zip(infos, records):
+        add_keys([info.get("name"), *info.get("ISO", {}).values()], record)
+    for info, record in zip(infos, records):
+        add_keys([info.get("nativeName"), *info.get("altSpellings", [])], record)
+    for info, record in zip(infos, records):
+        add_keys(info.get("translations", {}).values(), record)
+
+    by_name = {record["name"]: record for record in records}
+    for alias, name in COUNTRY_ALIASES.items():
+        if name in by_name:
+            add_keys([alias], by_name[name])
+    return index
+
+COUNTRY_INDEX = build_country_index()
+
+@lru_cache(maxsize=1024)
+def lookup_country(name):
+    """Return the trimmed record for a country name, code or translation, or None if unknown.
+
+    Results are memoized per raw input, so repeated spellings skip normalization too.
+    """
+    return COUNTRY_INDEX.get(normalize_country_name(name))
@@ -0,0 +1,723 @@
+"""SQLite persistence for StyleGenie: users, conversations, messages, images and memories."""
+import base64
+import hashlib
+import json
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from images import describe_image
+from tracing import span, traced
+
+# Database setup
+DB_PATH = 'data.db'  # SQLite file path; can be adjusted for cloud deployments
+CONVERSATIONS_PAGE_SIZE = 20  # Conversations listed in the sidebar per page
+
+# Connection settings
+BUSY_TIMEOUT_MS = 5000  # How long a writer waits for the lock before failing
+MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the database file memory-mapped for reads
+POOL_SIZE = 8  # Idle connections kept open for reuse
+
+# Image cache settings
+IMAGE_CACHE_BYTES = 64 * 1024 * 1024  # Loaded image bytes kept in memory for rendering (per process)
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+_local = threading.local()
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+_image_cache = OrderedDict()  # hash -> image bytes (images are immutable, so entries never go stale)
+_image_cache_bytes = 0
+_image_cache_lock = threading.Lock()
+
+def _open_connection():
+    """Open a new connection configured for concurrent access"""
+    # isolation_level=None: reads run in autocommit mode, writes use explicit transactions (see transaction())
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        isolation_level=None,
+        check_same_thread=False
+    )
+    # WAL lets readers proceed while a single writer commits
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+    return conn
+
+@contextmanager
+def connection():
+    """Borrow a configured database connection.
+
+    Connections are pooled and reused across calls. While a thread holds one,
+    nested calls on that thread get the same connection instead of opening a
+    second one.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+    
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_connection()
+    
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            _pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+@contextmanager
+def transaction():
+    """Run a block of writes atomically and yield a cursor.
+
+    The write lock is taken up front (BEGIN IMMEDIATE) so concurrent writers
+    queue on busy_timeout instead of failing mid-transaction. Nested calls
+    join the outer transaction.
+    """
+    with connection() as conn:
+        if conn.in_transaction:
+            yield conn.cursor()
+            return
+        
+        # Time spent queueing for the write lock shows up as its own span
+        with span("db.lock_wait"):
+            conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn.cursor()
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def guess_image_mime(image_bytes):
+    """Guess the MIME type of encoded image bytes from their magic number"""
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if image_bytes[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+def put_image_blob(cursor, image_bytes, mime_type=None, info=None):
+    """Store image bytes in the images table (once per content) and return their hash.
+
+    The image's dimensions and format (info, from describe_image) are stored
+    alongside it so they never have to be read from the bytes again; they are
+    computed here when not given. Invalid images are stored without them.
+    """
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    if info is None:
+        info = describe_image(image_bytes) or {}
+    cursor.execute('''
+        INSERT OR IGNORE INTO images (hash, data, mime_type, size, width, height, format)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        image_hash, sqlite3.Binary(image_bytes), mime_type or guess_image_mime(image_bytes), len(image_bytes),
+        info.get('width'), info.get('height'), info.get('format')
+    ))
+    return image_hash
+
+def image_info(width, height, image_format):
+    """Build a message's image_info metadata from stored image columns ({'valid': False} if unusable)"""
+    if not width or not height or width <= 0 or height <= 0 or not image_format:
+        return {'valid': False}
+    return {'valid': True, 'width': width, 'height': height, 'format': image_format}
+
+def init_db():
+    """Initialize the database and create tables if they don't exist (once per process)."""
+    with _init_lock:
+        if DB_PATH in _initialized_paths:
+            return
+        
+        with transaction() as cursor:
+            # Table for users (to manage sessions)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT UNIQUE NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Table for conversations (chat history per user)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS conversations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    conversation_id TEXT NOT NULL,
+                    title TEXT,
+                    messages TEXT,
+                    preview TEXT,
+                    message_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+
+            # The sidebar preview and message count are kept on the conversation row (see append_messages)
+            conversation_columns = [row[1] for row in cursor.execute('PRAGMA table_info(conversations)')]
+            summary_columns_added = 'preview' not in conversation_columns
+            if summary_columns_added:
+                cursor.execute('ALTER TABLE conversations ADD COLUMN preview TEXT')
+                cursor.execute('ALTER TABLE conversations ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_user
+                ON conversations (user_id, conversation_id)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_conversations_user_updated
+                ON conversations (user_id, updated_at)
+            ''')
+
+            # Table for images (content-addressed: each distinct image is stored once, keyed by its SHA-256)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS images (
+                    hash TEXT PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    mime_type TEXT,
+                    size INTEGER,
+                    width INTEGER,
+                    height INTEGER,
+                    format TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Table for messages (one row per chat message, appended turn by turn)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT,
+                    image_hash TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE (conversation_id, seq)
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_messages_image_hash
+                ON messages (image_hash)
+            ''')
+
+            # Move messages stored as a JSON blob on the conversation row into the messages table
+            cursor.execute('''
+                SELECT conversation_id, messages FROM conversations
+                WHERE messages IS NOT NULL AND messages != ''
+            ''')
+            for conv_id, messages_json in cursor.fetchall():
+                try:
+                    legacy_messages = json.loads(messages_json)
+                except json.JSONDecodeError:
+                    legacy_messages = []
+                for seq, msg in enumerate(legacy_messages):
+                    image_hash = None
+                    if msg.get('image'):
+                        try:
+                            image_hash = put_image_blob(cursor, base64.b64decode(msg['image']))
+                        except (ValueError, TypeError):
+                            image_hash = None
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO messages (conversation_id, seq, role, content, image_hash)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', (conv_id, seq, msg.get('role', 'user'), str(msg.get('content', '')), image_hash))
+                cursor.execute('UPDATE conversations SET messages = NULL WHERE conversation_id = ?', (conv_id,))
+                refresh_conversation_summary(cursor, conv_id)
+
+            # Conversations stored before previews and counts were kept on the row
+            if summary_columns_added:
+                cursor.execute('SELECT conversation_id FROM conversations')
+                for (conv_id,) in cursor.fetchall():
+                    refresh_conversation_summary(cursor, conv_id)
+
+            # Table for memories (local memory backend and mirror of mem0, see memory.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS memories (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    memory_data TEXT,  
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users (user_id)
+                )
+            ''')
+
+            # external_id is the mem0 memory id for mirrored rows, NULL for memories written locally
+            memory_columns = [row[1] for row in cursor.execute('PRAGMA table_info(memories)')]
+            if 'external_id' not in memory_columns:
+                cursor.execute('ALTER TABLE memories ADD COLUMN external_id TEXT')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_memories_user_created
+                ON memories (user_id, created_at)
+            ''')
+
+            # Full-text index over memory_data, kept in sync with the memories table by triggers
+            fts_exists = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memories_fts'"
+            ).fetchone()
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts
+                USING fts5(memory_data, content='memories', content_rowid='id')
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS memories_fts_insert AFTER INSERT ON memories BEGIN
+                    INSERT INTO memories_fts (rowid, memory_data) VALUES (new.id, new.memory_data);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS memories_fts_delete AFTER DELETE ON memories BEGIN
+                    INSERT INTO memories_fts (memories_fts, rowid, memory_data) VALUES ('delete', old.id, old.memory_data);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS memories_fts_update AFTER UPDATE OF memory_data ON memories BEGIN
+                    INSERT INTO memories_fts (memories_fts, rowid, memory_data) VALUES ('delete', old.id, old.memory_data);
+                    INSERT INTO memories_fts (rowid, memory_data) VALUES (new.id, new.memory_data);
+                END
+            ''')
+            if not fts_exists:
+                # Index rows written before the full-text index existed
+                cursor.execute("INSERT INTO memories_fts (memories_fts) VALUES ('rebuild')")
+
+            # When each user's mem0 memories were last copied into the memories table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS memory_mirrors (
+                    user_id TEXT PRIMARY KEY,
+                    synced_at REAL NOT NULL
+                )
+            ''')
+
+            # Table for cached web search results (see search.py)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    results TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_search_cache_created
+                ON search_cache (created_at)
+            ''')
+        
+        _initialized_paths.add(DB_PATH)
+
+# Conversation management functions
+@traced("db.ensure_user_exists")
+def ensure_user_exists(user_id):
+    """Ensure a user record exists in the database"""
+    with transaction() as cursor:
+        cursor.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
+
+@traced("db.store_image")
+def store_image(image_bytes, mime_type=None, info=None):
+    """Save image bytes in the content-addressed image store and return their hash"""
+    with transaction() as cursor:
+        return put_image_blob(cursor, image_bytes, mime_type, info)
+
+@traced("db.load_image")
+def load_image(image_hash):
+    """Load image bytes from the image store (None if the hash is unknown).
+
+    Recently loaded images are served from an in-process cache bounded by
+    IMAGE_CACHE_BYTES, so redrawing a conversation does not re-read them.
+    """
+    global _image_cache_bytes
+    with _image_cache_lock:
+        if image_hash in _image_cache:
+            _image_cache.move_to_end(image_hash)
+            return _image_cache[image_hash]
+
+    with connection() as conn:
+        row = conn.execute('SELECT data FROM images WHERE hash = ?', (image_hash,)).fetchone()
+    if not row:
+        return None
+    image_bytes = bytes(row[0])
+
+    with _image_cache_lock:
+        if image_hash not in _image_cache and len(image_bytes) <= IMAGE_CACHE_BYTES:
+            _image_cache[image_hash] = image_bytes
+            _image_cache_bytes += len(image_bytes)
+            while _image_cache_bytes > IMAGE_CACHE_BYTES:
+                _, evicted = _image_cache.popitem(last=False)
+                _image_cache_bytes -= len(evicted)
+    return image_bytes
+
+def clear_image_cache():
+    """Empty the in-process cache of loaded images"""
+    global _image_cache_bytes
+    with _image_cache_lock:
+        _image_cache.clear()
+        _image_cache_bytes = 0
+
+def delete_orphan_images(cursor, image_hashes):
+    """Remove the given images unless a message still references them (one index lookup per image)"""
+    cursor.executemany('''
+        DELETE FROM images
+        WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM messages WHERE image_hash = ?)
+    ''', [(image_hash, image_hash) for image_hash in image_hashes])
+
+def delete_messages(cursor, condition, params):
+    """Delete the messages matching an SQL condition, then the images that only they referenced"""
+    cursor.execute(
+        f'SELECT DISTINCT image_hash FROM messages WHERE ({condition}) AND image_hash IS NOT NULL', params
+    )
+    image_hashes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(f'DELETE FROM messages WHERE {condition}', params)
+    delete_orphan_images(cursor, image_hashes)
+
+def serialize_message(message):
+    """Convert a chat message into a (role, content, image_hash) row for the messages table"""
+    return message.get("role", "user"), str(message.get("content", "")), message.get("image_hash")
+
+def format_preview(text, max_length=50):
+    """Truncate a message to a sidebar preview"""
+    preview = text[:max_length]
+    return preview + '...' if len(text) > max_length else preview
+
+def first_user_preview(messages):
+    """Return the sidebar preview of a list of messages (their first user message), or None"""
+    for msg in messages:
+        role, content, _ = serialize_message(msg)
+        if role == 'user' and content:
+            return format_preview(content)
+    return None
+
+def refresh_conversation_summary(cursor, conversation_id):
+    """Recompute a conversation's stored preview and message count from its messages"""
+    cursor.execute('''
+        SELECT content FROM messages
+        WHERE conversation_id = ? AND role = 'user' AND content != ''
+        ORDER BY seq LIMIT 1
+    ''', (conversation_id,))
+    row = cursor.fetchone()
+    cursor.execute('''
+        UPDATE conversations
+        SET preview = ?, message_count = (SELECT COUNT(*) FROM messages WHERE conversation_id = ?)
+        WHERE conversation_id = ?
+    ''', (format_preview(row[0]) if row else None, conversation_id, conversation_id))
+
+@traced("db.load_conversations")
+def load_conversations(user_id, limit=CONVERSATIONS_PAGE_SIZE, offset=0, default_title='New Conversation'):
+    """Load one page of conversation metadata (most recent first) for a specific user.
+
+    Messages are not loaded here; use load_conversation_messages() when a
+    conversation is opened. Each entry carries the stored 'preview' of its
+    first user message (None if the conversation has no user message yet)
+    and its 'message_count'. The page is read in updated_at order straight
+    from the (user_id, updated_at) index.
+    """
+    # Ensure user exists
+    ensure_user_exists(user_id)
+    
+    # Load conversations
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT conversation_id, title, created_at, updated_at, preview, message_count
+            FROM conversations
+            WHERE user_id = ?
+            ORDER BY updated_at DESC
+            LIMIT ? OFFSET ?
+        ''', (user_id, limit, offset)).fetchall()
+    
+    conversations = {}
+    for row in rows:
+        conv_id, title, created_at, updated_at, preview, message_count = row
+        conversations[conv_id] = {
+            'id': conv_id,
+            'title': title or f"{default_title} - {created_at}",
+            'preview': preview,
+            'message_count': message_count,
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+    
+    return conversations
+
+@traced("db.count_conversations")
+def count_conversations(user_id):
+    """Count all conversations of a user (used to know whether more pages exist)"""
+    with connection() as conn:
+        return conn.execute('SELECT COUNT(*) FROM conversations WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+@traced("db.load_conversation_messages")
+def load_conversation_messages(conversation_id):
+    """Load the messages of a single conversation, in order.
+
+    Messages with an image carry its 'image_hash' and its 'image_info'
+    (validity, dimensions and format, see image_info()), but not its bytes.
+    """
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT m.role, m.content, m.image_hash, i.width, i.height, i.format
+            FROM messages m
+            LEFT JOIN images i ON i.hash = m.image_hash
+            WHERE m.conversation_id = ?
+            ORDER BY m.seq
+        ''', (conversation_id,)).fetchall()
+    
+    messages = []
+    for role, content, image_hash, width, height, image_format in rows:
+        message = {'role': role, 'content': content or ''}
+        if image_hash:
+            message['image_hash'] = image_hash
+            message['image_info'] = image_info(width, height, image_format)
+        messages.append(message)
+    
+    return messages
+
+@traced("db.insert_conversation")
+def insert_conversation(user_id, conv_data):
+    """Create the database record for a new (empty) conversation"""
+    with transaction() as cursor:
+        # Ensure user exists
+        ensure_user_exists(user_id)
+        
+        cursor.execute('''
+            INSERT INTO conversations (user_id, conversation_id, title, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (
+            user_id,
+            conv_data['id'],
+            conv_data.get('title', ''),
+            conv_data.get('created_at', datetime.now().strftime("%Y-%m-%d %H:%M")),
+            conv_data.get('updated_at', datetime.now().strftime("%Y-%m-%d %H:%M"))
+        ))
+
+@traced("db.append_messages")
+def append_messages(user_id, conversation_id, messages):
+    """Append new messages to the end of a conversation and bump its updated_at.
+
+    Only the given messages are written, so the cost of a chat turn does not
+    depend on how long the conversation (or the user's history) already is.
+    The conversation's message_count is increased, and its preview is set
+    from the first user message if it has none yet.
+    """
+    with transaction() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE conversation_id = ?',
+            (conversation_id,)
+        )
+        next_seq = cursor.fetchone()[0]
+        
+        cursor.executemany('''
+            INSERT INTO messages (conversation_id, seq, role, content, image_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (conversation_id, next_seq + offset, *serialize_message(msg))
+            for offset, msg in enumerate(messages)
+        ])
+        
+        cursor.execute('''
+            UPDATE conversations
+            SET updated_at = ?, message_count = message_count + ?, preview = COALESCE(preview, ?)
+            WHERE user_id = ? AND conversation_id = ?
+        ''', (
+            datetime.now().strftime("%Y-%m-%d %H:%M"), len(messages), first_user_preview(messages),
+            user_id, conversation_id
+        ))
+
+@traced("db.clear_conversation_messages")
+def clear_conversation_messages(user_id, conversation_id):
+    """Remove every message from a conversation while keeping the conversation itself"""
+    with transaction() as cursor:
+        delete_messages(cursor, '''
+            conversation_id IN (
+                SELECT conversation_id FROM conversations WHERE user_id = ? AND conversation_id = ?
+            )
+        ''', (user_id, conversation_id))
+        cursor.execute('''
+            UPDATE conversations
+            SET updated_at = ?, message_count = 0, preview = NULL
+            WHERE user_id = ? AND conversation_id = ?
+        ''', (datetime.now().strftime("%Y-%m-%d %H:%M"), user_id, conversation_id))
+
+@traced("db.save_conversations")
+def save_conversations(conversations, user_id):
+    """Sync conversations to database for a specific user.
+
+    Conversation rows are created if missing, and only messages that are not
+    stored yet are appended; existing rows are never rewritten. A conversation
+    whose in-memory history got shorter (e.g. cleared) is truncated to match.
+    """
+    with transaction() as cursor:
+        # Ensure user exists
+        ensure_user_exists(user_id)
+        
+        cursor.execute('''
+            SELECT conversation_id, message_count
+            FROM conversations
+            WHERE user_id = ?
+        ''', (user_id,))
+        stored_counts = dict(cursor.fetchall())
+        
+        for conv_id, conv_data in conversations.items():
+            messages = conv_data.get('messages')
+            stored = stored_counts.get(conv_id)
+            
+            if messages is None:
+                # Messages of this conversation were never loaded: nothing to sync
+                if stored is not None:
+                    continue
+                messages = []
+            
+            if stored is None:
+                cursor.execute('''
+                    INSERT INTO conversations (user_id, conversation_id, title, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (
+                    user_id,
+                    conv_id,
+                    conv_data.get('title', ''),
+                    conv_data.get('created_at', datetime.now().strftime("%Y-%m-%d %H:%M")),
+                    conv_data.get('updated_at', datetime.now().strftime("%Y-%m-%d %H:%M"))
+                ))
+                stored = 0
+            elif stored == len(messages):
+                continue
+            elif stored > len(messages):
+                delete_messages(cursor, 'conversation_id = ? AND seq >= ?', (conv_id, len(messages)))
+                stored = len(messages)
+            
+            cursor.executemany('''
+                INSERT INTO messages (conversation_id, seq, role, content, image_hash)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (conv_id, seq, *serialize_message(msg))
+                for seq, msg in enumerate(messages[stored:], start=stored)
+            ])
+            cursor.execute('''
+                UPDATE conversations
+                SET updated_at = ?
+                WHERE user_id = ? AND conversation_id = ?
+            ''', (
+                conv_data.get('updated_at', datetime.now().strftime("%Y-%m-%d %H:%M")),
+                user_id,
+                conv_id
+            ))
+            refresh_conversation_summary(cursor, conv_id)
+
+@traced("db.delete_conversation")
+def delete_conversation(user_id, conversation_id):
+    """Delete a specific conversation and its messages from the database"""
+    with transaction() as cursor:
+        delete_messages(cursor, '''
+            conversation_id IN (
+                SELECT conversation_id FROM conversations WHERE user_id = ? AND conversation_id = ?
+            )
+        ''', (user_id, conversation_id))
+        cursor.execute('DELETE FROM conversations WHERE user_id = ? AND conversation_id = ?', (user_id, conversation_id))
+
+@traced("db.update_conversation_title")
+def update_conversation_title(user_id, conversation_id, new_title):
+    """Update the title of a conversation"""
+    with transaction() as cursor:
+        cursor.execute('''
+            UPDATE conversations
+            SET title = ?, updated_at = ?
+            WHERE user_id = ? AND conversation_id = ?
+        ''', (new_title, datetime.now().strftime("%Y-%m-%d %H:%M"), user_id, conversation_id))
+
+# Memory functions (local memory backend, see memory.py)
+def memory_row(row):
+    """Convert a memories row into a mem0-style memory dict"""
+    memory_id, external_id, memory_data, created_at = row
+    return {'id': external_id or str(memory_id), 'memory': memory_data, 'created_at': created_at}
+
+@traced("db.insert_memory")
+def insert_memory(user_id, memory_data, external_id=None, created_at=None):
+    """Store one memory for a user"""
+    with transaction() as cursor:
+        cursor.execute('''
+            INSERT INTO memories (user_id, memory_data, external_id, created_at)
+            VALUES (?, ?, ?, COALESCE(datetime(?), CURRENT_TIMESTAMP))
+        ''', (user_id, memory_data, external_id, created_at))
+
+@traced("db.load_memories")
+def load_memories(user_id, limit=50):
+    """Load a user's most recent memories, newest first"""
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT id, external_id, memory_data, created_at
+            FROM memories
+            WHERE user_id = ?
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ''', (user_id, limit)).fetchall()
+    return [memory_row(row) for row in rows]
+
+@traced("db.search_memory_index")
+def search_memory_index(user_id, query, limit=10, recency_days=30):
+    """Full-text search over a user's memories, ranked by relevance and recency.
+
+    Every word of the query is matched as a prefix and any word may match.
+    The BM25 relevance of a memory is divided by 1 + its age / recency_days,
+    so among equally relevant memories the newer ones come first.
+    """
+    terms = re.findall(r'\w+', query.casefold())
+    if not terms:
+        return []
+    match = ' OR '.join(f'"{term}"*' for term in terms)
+    with connection() as conn:
+        rows = conn.execute('''
+            SELECT m.id, m.external_id, m.memory_data, m.created_at
+            FROM memories_fts
+            JOIN memories m ON m.id = memories_fts.rowid
+            WHERE memories_fts MATCH ? AND m.user_id = ?
+            ORDER BY bm25(memories_fts) / (1 + (julianday('now') - julianday(m.created_at)) / ?)
+            LIMIT ?
+        ''', (match, user_id, recency_days, limit)).fetchall()
+    return [memory_row(row) for row in rows]
+
+@traced("db.mirrored_memories_synced_at")
+def mirrored_memories_synced_at(user_id):
+    """Return when a user's mem0 memories were last mirrored (a Unix timestamp), or None if never"""
+    with connection() as conn:
+        row = conn.execute('SELECT synced_at FROM memory_mirrors WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+@traced("db.replace_mirrored_memories")
+def replace_mirrored_memories(user_id, memories, pending=()):
+    """Replace a user's mirrored mem0 memories with a fresh copy and record when it was taken.
+
+    memories are mem0 memory dicts (id, memory, created_at). Locally written
+    memories are dropped unless their text is still in pending, i.e. mem0 has
+    not processed them yet; once it has, the mirrored copy replaces them.
+    """
+    pending = list(pending)
+    with transaction() as cursor:
+        cursor.execute(
+            'INSERT OR REPLACE INTO memory_mirrors (user_id, synced_at) VALUES (?, ?)',
+            (user_id, time.time())
+        )
+        cursor.execute('DELETE FROM memories WHERE user_id = ? AND external_id IS NOT NULL', (user_id,))
+        cursor.execute(f'''
+            DELETE FROM memories
+            WHERE user_id = ? AND external_id IS NULL
+            AND memory_data NOT IN ({', '.join('?' * len(pending))})
+        ''', (user_id, *pending))
+        cursor.executemany('''
+            INSERT INTO memories (user_id, memory_data, external_id, created_at)
+            VALUES (?, ?, ?, COALESCE(datetime(?), CURRENT_TIMESTAMP))
+        ''', [
+            (user_id, memory.get('memory', ''), str(memory.get('id')), memory.get('created_at'))
+            for memory in memories
+        ])
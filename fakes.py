@@ -0,0 +1,307 @@
+"""Local fakes of StyleGenie's external services, for offline and load testing (PROVIDER_MODE=fake).
+
+Each fake answers with canned payloads after a sampled latency and fails
+with a configurable error rate. Profiles per service are in FAKE_PROFILES
+and can be overridden with FAKE_PROVIDER_CONFIG, either a JSON string or
+the path of a JSON file, e.g.:
+
+    {"genai": {"latency": {"dist": "fixed", "seconds": 2}}, "tavily": {"error_rate": 0.05}}
+
+Latency specs: {"dist": "none"}, {"dist": "fixed", "seconds": s},
+{"dist": "uniform", "low": a, "high": b}, {"dist": "normal", "mean": m, "stdev": sd}
+or {"dist": "lognormal", "median": m, "sigma": s}.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from io import BytesIO
+
+from google.genai import types
+from PIL import Image, ImageDraw
+from strands.models import Model
+
+FAKE_PROFILES = {
+    # Chat model (replaces GeminiModel): latency before the first token, then per streamed chunk
+    "chat_model": {
+        "latency": {"dist": "lognormal", "median": 0.6, "sigma": 0.4},
+        "chunk_latency": {"dist": "fixed", "seconds": 0.02},
+        "error_rate": 0.0,
+        "reply": "Here are a few ideas that would suit you: a navy linen blazer, white sneakers and a light cotton shirt.",
+        # First matching rule picks the tool called for a new user message (rules for tools the agent lacks are skipped)
+        "tool_rules": [
+            {"pattern": r"", "unless": r"\[Memory snapshot\]", "first_turn": True, "tool": "get_all_memories", "input": {"prompt": "user info", "user_id": "{user_id}"}},
+            {"pattern": r"\b(change|edit|make it|replace|try on)\b", "tool": "generate_image", "input": {"prompt": "{message}"}},
+            {"pattern": r"\b(find|buy|shop|link|where)\b", "tool": "web_search", "input": {"search": "{message}"}},
+            {"pattern": r"\b(my country|i live in|i'm from|i am from)\b", "tool": "user_country", "input": {"name": "France"}},
+            {"pattern": r"\b(my name is|i like|i love|i prefer)\b", "tool": "add_memories", "input": {"prompt": "{message}", "user_id": "{user_id}"}},
+        ],
+    },
+    # Image editing (replaces the genai Client)
+    "genai": {
+        "latency": {"dist": "lognormal", "median": 6.0, "sigma": 0.3},
+        "error_rate": 0.0,
+        "text": "Here is your updated outfit.",
+        "image_size": 1024,
+    },
+    # Web search (replaces TavilyClient)
+    "tavily": {
+        "latency": {"dist": "lognormal", "median": 1.2, "sigma": 0.4},
+        "error_rate": 0.0,
+        "results": 5,
+    },
+    # User memory (replaces mem0's MemoryClient)
+    "memory": {
+        "latency": {"dist": "lognormal", "median": 0.3, "sigma": 0.3},
+        "error_rate": 0.0,
+    },
+}
+
+class FakeProviderError(Exception):
+    """Failure injected by a fake provider"""
+
+def load_profiles():
+    """Return FAKE_PROFILES with the FAKE_PROVIDER_CONFIG overrides applied"""
+    profiles = copy.deepcopy(FAKE_PROFILES)
+    override = os.environ.get("FAKE_PROVIDER_CONFIG", "").strip()
+    if override:
+        if not override.startswith("{"):
+            with open(override, encoding="utf-8") as f:
+                override = f.read()
+        for service, settings in json.loads(override).items():
+            profiles.setdefault(service, {}).update(settings)
+    return profiles
+
+def sample_latency(spec, rng=random):
+    """Draw one latency in seconds from a latency spec"""
+    dist = (spec or {}).get("dist", "none")
+    if dist == "none":
+        return 0.0
+    if dist == "fixed":
+        return spec["seconds"]
+    if dist == "uniform":
+        return rng.uniform(spec["low"], spec["high"])
+    if dist == "normal":
+        return max(0.0, rng.gauss(spec["mean"], spec["stdev"]))
+    if dist == "lognormal":
+        return rng.lognormvariate(0, spec["sigma"]) * spec["median"]
+    raise ValueError(f"Unknown latency distribution: {dist}")
+
+class FakeService:
+    """Shared behaviour of the fakes: sampled latency and injected errors"""
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _delay(self, key="latency"):
+        with self._lock:
+            self.calls += 1
+        return sample_latency(self.profile.get(key))
+
+    def _maybe_fail(self, operation):
+        if random.random() < self.profile.get("error_rate", 0.0):
+            raise FakeProviderError(f"Injected {self.name} failure in {operation}")
+
+    def wait(self, operation):
+        """Block for a sampled latency, then maybe fail"""
+        time.sleep(self._delay())
+        self._maybe_fail(operation)
+
+    async def wait_async(self, operation):
+        """Sleep (without blocking the loop) for a sampled latency, then maybe fail"""
+        await asyncio.sleep(self._delay())
+        self._maybe_fail(operation)
+
+def fake_image(prompt, size):
+    """Render a PNG standing in for a generated outfit: a gradient in a colour derived from the prompt"""
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    color = tuple(digest[:3])
+    image = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    tint = Image.new("RGB", (size, size), color)
+    image = Image.blend(image, tint, 0.6)
+    ImageDraw.Draw(image).text((16, 16), prompt[:60], fill=(255, 255, 255))
+    output = BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+class FakeGenaiClient:
+    """Stand-in for google.genai.Client: models.generate_content and aio.models.generate_content"""
+
+    def __init__(self, profile):
+        self.service = FakeService("genai", profile)
+        self.models = _FakeModels(self.service)
+        self.aio = _FakeAio(_FakeAsyncModels(self.service))
+
+def _generate_response(service, contents):
+    """Build a GenerateContentResponse with the canned text and a generated image"""
+    prompt = " ".join(part for part in contents if isinstance(part, str)) or "outfit"
+    image_bytes = fake_image(prompt, service.profile.get("image_size", 1024))
+    return types.GenerateContentResponse(candidates=[
+        types.Candidate(content=types.Content(role="model", parts=[
+            types.Part(text=service.profile.get("text", "")),
+            types.Part.from_bytes(data=image_bytes, mime_type="image/png"),
+        ]))
+    ])
+
+class _FakeModels:
+    def __init__(self, service):
+        self.service = service
+
+    def generate_content(self, model, contents, config=None):
+        self.service.wait("generate_content")
+        return _generate_response(self.service, contents)
+
+class _FakeAsyncModels:
+    def __init__(self, service):
+        self.service = service
+
+    async def generate_content(self, model, contents, config=None):
+        await self.service.wait_async("generate_content")
+        return _generate_response(self.service, contents)
+
+class _FakeAio:
+    def __init__(self, models):
+        self.models = models
+
+class FakeTavilyClient:
+    """Stand-in for TavilyClient.search"""
+
+    def __init__(self, profile):
+        self.service = FakeService("tavily", profile)
+
+    def search(self, query, search_depth="basic", max_results=5, **kwargs):
+        self.service.wait("search")
+        count = min(max_results, self.service.profile.get("results", 5))
+        slug = re.sub(r"\W+", "-", query.casefold()).strip("-") or "item"
+        return {
+            "query": query,
+            "results": [
+                {
+                    "title": f"{query.title()} – option {i + 1}",
+                    "url": f"https://shop.example.com/{slug}/{i + 1}",
+                    "content": f"Sample listing {i + 1} for {query}.",
+                    "score": round(1 - i * 0.1, 2),
+                }
+                for i in range(count)
+            ],
+        }
+
+class FakeMemoryClient:
+    """Stand-in for mem0's MemoryClient, keeping memories in process memory"""
+
+    def __init__(self, profile):
+        self.service = FakeService("memory", profile)
+        self._memories = {}  # user_id -> [memory dict]
+        self._lock = threading.Lock()
+
+    def add(self, messages, user_id=None, **kwargs):
+        self.service.wait("add")
+        if isinstance(messages, str):
+            messages = [{"role": "user", "content": messages}]
+        elif isinstance(messages, dict):
+            messages = [messages]
+        added = [
+            {
+                "id": str(uuid.uuid4()),
+                "memory": message["content"],
+                "user_id": user_id,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+            }
+            for message in messages if message.get("role") == "user"
+        ]
+        with self._lock:
+            self._memories.setdefault(user_id, []).extend(added)
+        return {"results": [{"id": memory["id"], "event": "ADD", "memory": memory["memory"]} for memory in added]}
+
+    def get_all(self, filters=None, page=1, page_size=50, **kwargs):
+        self.service.wait("get_all")
+        with self._lock:
+            memories = list(reversed(self._memories.get(_filter_user(filters), [])))
+        results = memories[(page - 1) * page_size:page * page_size]
+        return {"count": len(memories), "next": None, "previous": None, "results": results}
+
+    def search(self, query, filters=None, **kwargs):
+        self.service.wait("search")
+        words = set(re.findall(r"\w+", query.casefold()))
+        with self._lock:
+            memories = self._memories.get(_filter_user(filters), [])
+            results = [m for m in memories if words & set(re.findall(r"\w+", m["memory"].casefold()))]
+        return {"results": results}
+
+def _filter_user(filters):
+    """Extract the user_id from a mem0 filter ({"AND": [{"user_id": ...}]} or {"user_id": ...})"""
+    filters = filters or {}
+    for clause in filters.get("AND", [filters]):
+        if "user_id" in clause:
+            return clause["user_id"]
+    return None
+
+class FakeChatModel(Model):
+    """Stand-in for GeminiModel: streams a canned reply, calling tools according to keyword rules.
+
+    Tool inputs may use {message} (the latest user text) and {user_id} (the
+    first UUID found in the system prompt, where the app puts the user id).
+    """
+
+    def __init__(self, profile=None, model_id="fake-chat"):
+        self.config = {"model_id": model_id}
+        self.service = FakeService("chat_model", profile if profile is not None else load_profiles()["chat_model"])
+
+    def update_config(self, **model_config):
+        self.config.update(model_config)
+
+    def get_config(self):
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        """Answer with an empty instance of output_model (built without validation) after the sampled latency"""
+        await self.service.wait_async("structured_output")
+        yield {"output": output_model.model_construct()}
+
+    def _tool_call(self, messages, tool_specs, system_prompt):
+        """Return (tool name, input) for this step, or None to answer with text"""
+        last = messages[-1]
+        if last["role"] != "user" or any("toolResult" in block for block in last["content"]):
+            return None
+        available = {spec["name"] for spec in tool_specs or []}
+        text = " ".join(block["text"] for block in last["content"] if "text" in block)
+        first_turn = sum(1 for message in messages if message["role"] == "user") == 1
+        user_match = re.search(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}", system_prompt or "")
+        for rule in self.service.profile.get("tool_rules", []):
+            if rule["tool"] not in available or (rule.get("first_turn") and not first_turn):
+                continue
+            if rule.get("unless") and re.search(rule["unless"], text):
+                continue
+            if re.search(rule["pattern"], text, re.IGNORECASE):
+                values = {"message": text, "user_id": user_match.group(0) if user_match else "anonymous"}
+                return rule["tool"], {key: value.format(**values) for key, value in rule["input"].items()}
+        return None
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        await self.service.wait_async("stream")
+        yield {"messageStart": {"role": "assistant"}}
+
+        tool_call = self._tool_call(messages, tool_specs, system_prompt)
+        if tool_call is not None:
+            name, tool_input = tool_call
+            yield {"contentBlockStart": {"start": {"toolUse": {"name": name, "toolUseId": f"fake-{uuid.uuid4().hex[:8]}"}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(tool_input)}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+            return
+
+        for word in re.findall(r"\S+\s*", self.service.profile.get("reply", "")):
+            await asyncio.sleep(self.service._delay("chunk_latency"))
+            yield {"contentBlockDelta": {"delta": {"text": word}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
@@ -0,0 +1,43 @@
+"""Agent history for StyleGenie: turn saved chat messages into agent input."""
+from database import load_image
+
+def build_history_input(messages, window=None):
+    """Build agent input entries from saved chat messages.
+
+    Only the last `window` messages are included (all of them if None), and
+    only the most recent image among them is attached, so replaying a long
+    image-heavy conversation stays bounded. Messages marked "unsaved" (a
+    failed turn's prompt and error) are left out.
+    """
+    messages = [m for m in messages if not m.get("unsaved")]
+    if window is not None:
+        messages = messages[-window:] if window > 0 else []
+    
+    last_image_index = None
+    for index, m in enumerate(messages):
+        if m.get("image_hash"):
+            last_image_index = index
+    
+    history_input = []
+    for index, m in enumerate(messages):
+        entry = {}
+        content = m.get("content", "")
+        if content:
+            entry["text"] = str(content)
+        entry["role"] = m.get("role", "user")
+        # Include the most recent image from the saved conversation
+        if index == last_image_index:
+            # Validity was recorded when the image was saved
+            image_bytes = None
+            if m.get("image_info", {}).get("valid"):
+                image_bytes = load_image(m["image_hash"])
+            
+            if image_bytes:
+                entry["image"] = {
+                    "format": "jpeg",
+                    "source": {"bytes": image_bytes},
+                }
+        
+        history_input.append(entry)
+    
+    return history_input
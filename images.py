@@ -0,0 +1,115 @@
+"""Image ingestion for StyleGenie: decode, orient, downscale and re-encode images before they reach a model."""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from tracing import traced
+
+# Size budget per consumer: longest edge in pixels and JPEG quality of the normalized image
+IMAGE_TARGETS = {
+    "chat": {"max_edge": 1024, "quality": 85},  # Vision input for the chat agent
+    "edit": {"max_edge": 1536, "quality": 92},  # Source image for outfit editing with the image model
+}
+
+CACHE_SIZE = 64  # Normalized images kept in memory (per process)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+@traced("image.describe")
+def describe_image(image_bytes):
+    """Return {"width", "height", "format"} of encoded image bytes, or None if they are not a valid image.
+
+    Only the image header is read; the pixels are not decoded.
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            width, height = image.size
+            image_format = image.format
+    except Exception:
+        return None
+    if width <= 0 or height <= 0 or not image_format:
+        return None
+    return {"width": width, "height": height, "format": image_format}
+
+@traced("image.normalize")
+def normalize_image(image_bytes, max_edge, quality):
+    """Decode image bytes and return them as an upright RGB JPEG no larger than max_edge on either side"""
+    image = Image.open(BytesIO(image_bytes))
+
+    # Reduce on decode: large JPEGs are decoded directly at a smaller scale (still >= max_edge)
+    if image.format == "JPEG" and max(image.size) > max_edge:
+        image.draft("RGB", (max_edge, max_edge))
+
+    # Apply the EXIF orientation so phone photos are not sent sideways
+    image = ImageOps.exif_transpose(image)
+
+    # Flatten transparency on white and convert everything else to RGB
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    if image.size[0] <= 0 or image.size[1] <= 0:
+        raise ValueError(f"Invalid image dimensions: {image.size}")
+
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    image.save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+def prepare_image(image_bytes, target="chat", image_hash=None):
+    """Return normalized JPEG bytes of an image for a consumer in IMAGE_TARGETS.
+
+    Results are cached by content hash and target, so the same upload is only
+    decoded and re-encoded once no matter how many consumers ask for it.
+    Pass image_hash (SHA-256 hex of image_bytes) when it is already known.
+    """
+    settings = IMAGE_TARGETS[target]
+    key = (image_hash or hashlib.sha256(image_bytes).hexdigest(), target)
+
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    normalized = normalize_image(image_bytes, settings["max_edge"], settings["quality"])
+
+    with _cache_lock:
+        _cache[key] = normalized
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return normalized
+
+@traced("image.ingest")
+def ingest_image(image_bytes):
+    """Process an uploaded image for every target and return its record.
+
+    The record holds the content hash, the original dimensions and format, and
+    the normalized JPEG bytes per target (record["chat"], record["edit"], ...).
+    The original bytes are not kept.
+    """
+    with Image.open(BytesIO(image_bytes)) as image:
+        width, height = image.size
+        image_format = image.format
+
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    record = {
+        "hash": image_hash,
+        "width": width,
+        "height": height,
+        "format": image_format,
+        "size": len(image_bytes),
+    }
+    for target in IMAGE_TARGETS:
+        record[target] = prepare_image(image_bytes, target, image_hash)
+    return record
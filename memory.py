@@ -0,0 +1,274 @@
+"""User memory for StyleGenie: mem0, a local SQLite store, or the local store as a read-through cache in front of mem0."""
+import atexit
+import contextvars
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from database import (
+    init_db, insert_memory, load_memories, mirrored_memories_synced_at, replace_mirrored_memories, search_memory_index,
+)
+from providers import get_memory_client, get_secret, is_fake_mode
+
+# Backend: "mem0" (remote only), "cached" (local SQLite copy in front of mem0) or "local" (fully offline).
+# None picks "cached" when MEM0_API_KEY is configured and "local" otherwise.
+MEMORY_BACKEND = None
+
+MEMORY_CACHE_TTL = 10 * 60  # Seconds a user's cached memories (the local copy in "cached" mode) stay valid
+MEMORY_CACHE_SIZE = 1000  # Users whose memories are cached in memory (least recently used are evicted first)
+MEMORY_PAGE_SIZE = 50  # Memories fetched per get_all call
+WRITE_BATCH_SIZE = 20  # Most messages sent to mem0 in one add call
+WRITE_BATCH_DELAY = 0.5  # Seconds the writer waits for more adds before sending a batch
+WRITE_RETRIES = 2  # Extra attempts for a batch that failed to reach mem0
+SHUTDOWN_FLUSH_TIMEOUT = 10  # Seconds to wait for queued writes when the process exits
+SEARCH_LIMIT = 10  # Memories returned by a local search
+RECENCY_DAYS = 30  # Age in days at which a local search match counts half as relevant
+PREFETCH_WORKERS = 4  # Threads loading memories for sessions that just started
+PREFETCH_WAIT = 2.0  # Seconds a first turn waits for a prefetch still in flight before going without it
+
+def user_filters(user_id):
+    """Return the mem0 filter selecting a single user's memories"""
+    return {"AND": [{"user_id": user_id}]}
+
+class Mem0MemoryStore:
+    """mem0 front end shared by all sessions in the process.
+
+    get_all results are cached per user in a bounded LRU whose entries expire
+    after cache_ttl, and invalidated whenever that user's writes reach mem0.
+    add only queues the message: a background thread batches queued messages
+    per user and sends them with one add call each, so memory writes never
+    wait on the network in the agent's turn. Messages still in the queue are
+    returned by get_all under "pending".
+    """
+
+    def __init__(self, cache_ttl=MEMORY_CACHE_TTL, max_entries=MEMORY_CACHE_SIZE):
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # user_id -> (fetched_at, memories), least recently used first
+        self._pending = {}  # user_id -> queued messages not yet sent to mem0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = None
+
+    def get_all(self, user_id):
+        """Return (memories, pending messages) for a user, from the cache when possible"""
+        with self._lock:
+            entry = self._cache.get(user_id)
+            if entry is not None:
+                if time.time() - entry[0] < self.cache_ttl:
+                    self._cache.move_to_end(user_id)
+                else:
+                    del self._cache[user_id]
+                    entry = None
+            pending = [message["content"] for message in self._pending.get(user_id, [])]
+        if entry is not None:
+            return entry[1], pending
+
+        memories = get_memory_client().get_all(
+            version="v2", filters=user_filters(user_id), page=1, page_size=MEMORY_PAGE_SIZE
+        )
+        if self.cache_ttl > 0:
+            with self._lock:
+                self._cache_memories(user_id, memories)
+        return memories, pending
+
+    def search(self, query, user_id):
+        """Search a user's memories in mem0"""
+        return get_memory_client().search(query, version="v2", filters=user_filters(user_id))
+
+    def add(self, content, user_id):
+        """Queue a user message to be stored in mem0 by the background writer"""
+        get_memory_client()  # Fail now, not in the writer, when mem0 is not configured
+        message = {"role": "user", "content": content}
+        with self._lock:
+            self._pending.setdefault(user_id, []).append(message)
+        self._ensure_writer()
+        self._queue.put((user_id, message, 0))
+
+    def invalidate(self, user_id):
+        """Drop a user's cached memories so the next get_all reads mem0"""
+        with self._lock:
+            self._cache.pop(user_id, None)
+
+    def flush(self, timeout=None):
+        """Wait until every queued write has been handled; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _cache_memories(self, user_id, memories):
+        """Cache a user's memories, then evict expired entries and the least recently used beyond max_entries (lock held)"""
+        now = time.time()
+        self._cache[user_id] = (now, memories)
+        self._cache.move_to_end(user_id)
+        while self._cache:
+            fetched_at, _ = next(iter(self._cache.values()))
+            if now - fetched_at < self.cache_ttl and len(self._cache) <= self.max_entries:
+                break
+            self._cache.popitem(last=False)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run_writer, name="stylegenie-memory-writer", daemon=True)
+                self._writer.start()
+
+    def _next_batch(self):
+        """Block for one queued write, then collect more for up to WRITE_BATCH_DELAY"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + WRITE_BATCH_DELAY
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_writer(self):
+        while True:
+            batch = self._next_batch()
+
+            by_user = {}
+            for user_id, message, attempt in batch:
+                by_user.setdefault(user_id, []).append((message, attempt))
+
+            for user_id, items in by_user.items():
+                messages = [message for message, _ in items]
+                try:
+                    get_memory_client().add(messages, user_id=user_id)
+                    print(f"Memory batch of {len(messages)} added for user: {user_id}")
+                    self._done(user_id, messages)
+                except Exception as e:
+                    print(f"Error adding memory batch for user {user_id}: {str(e)}")
+                    for message, attempt in items:
+                        if attempt < WRITE_RETRIES:
+                            self._queue.put((user_id, message, attempt + 1))
+                        else:
+                            self._done(user_id, [message])
+
+            for _ in batch:
+                self._queue.task_done()
+
+    def _done(self, user_id, messages):
+        """Forget written (or abandoned) messages and invalidate the user's cached memories"""
+        with self._lock:
+            pending = self._pending.get(user_id, [])
+            for message in messages:
+                if message in pending:
+                    pending.remove(message)
+            if not pending:
+                self._pending.pop(user_id, None)
+            self._cache.pop(user_id, None)
+
+class LocalMemoryStore:
+    """Memories kept in the local SQLite memories table, searched through its FTS5 index"""
+
+    def __init__(self):
+        init_db()
+
+    def get_all(self, user_id):
+        """Return (memories, pending messages) for a user; local writes are never pending"""
+        return {"results": load_memories(user_id, MEMORY_PAGE_SIZE)}, []
+
+    def search(self, query, user_id):
+        """Full-text search over a user's memories, best and most recent matches first"""
+        return {"results": search_memory_index(user_id, query, SEARCH_LIMIT, RECENCY_DAYS)}
+
+    def add(self, content, user_id):
+        """Store a user message as a memory"""
+        insert_memory(user_id, content)
+
+    def flush(self, timeout=None):
+        return True
+
+class ReadThroughMemoryStore:
+    """mem0 behind a local SQLite copy of each user's memories.
+
+    get_all is answered from the local copy while it is younger than
+    cache_ttl, which also holds across restarts; a missing or stale copy is
+    refreshed from mem0 first. Searches still use mem0's semantic search.
+    Writes go to both stores, so a user's own writes show up locally right
+    away. If mem0 cannot be reached, reads and searches fall back to the
+    local copy (searched through its FTS5 keyword index), however old it is.
+    """
+
+    def __init__(self, remote, local, cache_ttl=MEMORY_CACHE_TTL):
+        self.remote = remote
+        self.local = local
+        self.cache_ttl = cache_ttl
+
+    def get_all(self, user_id):
+        """Return (memories, pending messages) from the local copy, refreshing it from mem0 when it is stale"""
+        synced_at = mirrored_memories_synced_at(user_id)
+        if synced_at is not None and time.time() - synced_at < self.cache_ttl:
+            return self.local.get_all(user_id)
+
+        try:
+            memories, pending = self.remote.get_all(user_id)
+        except Exception as e:
+            print(f"mem0 unavailable, reading local memories for user {user_id}: {str(e)}")
+            return self.local.get_all(user_id)
+
+        results = memories.get("results", []) if isinstance(memories, dict) else memories
+        replace_mirrored_memories(user_id, results or [], pending)
+        return memories, pending
+
+    def search(self, query, user_id):
+        """Search with mem0, falling back to a keyword search of the local copy when mem0 fails"""
+        try:
+            return self.remote.search(query, user_id)
+        except Exception as e:
+            print(f"mem0 unavailable, searching local memories for user {user_id}: {str(e)}")
+            return self.local.search(query, user_id)
+
+    def add(self, content, user_id):
+        """Store the message locally right away and queue it for mem0"""
+        self.local.add(content, user_id)
+        self.remote.add(content, user_id)
+
+    def flush(self, timeout=None):
+        return self.remote.flush(timeout)
+
+def create_memory_store(backend=MEMORY_BACKEND):
+    """Build the memory store for a backend name (see MEMORY_BACKEND)"""
+    if backend is None:
+        backend = "cached" if get_secret("MEM0_API_KEY") or is_fake_mode() else "local"
+    if backend == "mem0":
+        return Mem0MemoryStore()
+    if backend == "cached":
+        # The local copy is the cache, so mem0 reads are not cached again in memory
+        return ReadThroughMemoryStore(Mem0MemoryStore(cache_ttl=0), LocalMemoryStore())
+    if backend == "local":
+        return LocalMemoryStore()
+    raise ValueError(f"Unknown memory backend: {backend}")
+
+memory_store = create_memory_store()
+
+_prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="stylegenie-memory-prefetch")
+
+def prefetch_memories(user_id):
+    """Start loading a user's memories in the background and return the Future of memory_store.get_all.
+
+    The result also lands in the store's per-user cache, so a get_all_memories
+    call made later in the session is answered without a mem0 round-trip.
+    """
+    return _prefetch_executor.submit(contextvars.copy_context().run, memory_store.get_all, user_id)
+
+def prefetched_memories(future, timeout=PREFETCH_WAIT):
+    """Return (memories, pending) from a prefetch, or None if it failed or is not done within timeout"""
+    try:
+        return future.result(timeout=timeout)
+    except Exception as e:
+        print(f"Memory prefetch unavailable: {type(e).__name__}: {e}")
+        return None
+
+# Give queued writes a chance to reach mem0 before the process exits
+atexit.register(memory_store.flush, SHUTDOWN_FLUSH_TIMEOUT)
@@ -0,0 +1,172 @@
+"""Shared clients for StyleGenie's external services, created once per process.
+
+With PROVIDER_MODE=fake every client is replaced by the latency-injecting
+fakes in fakes.py, so the app runs offline without API keys.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import streamlit as st
+from google import genai
+from mem0 import MemoryClient
+from strands.models.gemini import GeminiModel
+from tavily import TavilyClient
+
+import fakes
+
+_genai_client = None
+_tavily_client = None
+_memory_client = None
+_http_session = None
+# One lock per client, so a slow client constructor (mem0 validates its key over the network) only holds up its own callers
+_genai_lock = threading.Lock()
+_tavily_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_http_session_lock = threading.Lock()
+
+_fake_profiles = None
+
+# Calls of each tool allowed in flight at once across all sessions of the process
+TOOL_CONCURRENCY = {
+    "generate_image": 4,
+    "web_search": 8,
+    "add_memories": 4,
+    "search_memories": 8,
+    "get_all_memories": 8,
+}
+
+_tool_executors = {}
+_tool_executors_lock = threading.Lock()
+_io_semaphores = {}  # Only touched from the I/O loop thread
+
+_io_loop = None
+_io_loop_lock = threading.Lock()
+
+def get_secret(name):
+    """Read a secret from Streamlit secrets, falling back to environment variables"""
+    try:
+        return st.secrets.get(name, os.environ.get(name))
+    except Exception:
+        return os.environ.get(name)
+
+def get_provider_mode():
+    """Return "live" (real services) or "fake" (fakes.py), from the PROVIDER_MODE setting"""
+    return (get_secret("PROVIDER_MODE") or "live").strip().lower()
+
+def is_fake_mode():
+    return get_provider_mode() == "fake"
+
+def get_fake_profile(service):
+    """Return the fake profile of a service (FAKE_PROFILES with FAKE_PROVIDER_CONFIG applied)"""
+    global _fake_profiles
+    if _fake_profiles is None:
+        _fake_profiles = fakes.load_profiles()
+    return _fake_profiles[service]
+
+def get_io_loop():
+    """Return the background event loop that owns the shared async clients.
+
+    Every agent call runs in its own short-lived event loop, but pooled async
+    HTTP connections belong to the loop that opened them. Async client calls
+    are therefore run on this single long-lived loop (see run_on_io_loop).
+    """
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            _io_loop = asyncio.new_event_loop()
+            threading.Thread(target=_io_loop.run_forever, name="stylegenie-io", daemon=True).start()
+    return _io_loop
+
+async def _limited(limit, coro):
+    """Await a coroutine once one of the limit's TOOL_CONCURRENCY slots is free (runs on the I/O loop)"""
+    if limit not in _io_semaphores:
+        _io_semaphores[limit] = asyncio.Semaphore(TOOL_CONCURRENCY[limit])
+    async with _io_semaphores[limit]:
+        return await coro
+
+async def run_on_io_loop(coro, limit=None):
+    """Await a coroutine on the shared I/O loop without blocking the caller's loop.
+
+    With limit (a TOOL_CONCURRENCY key), at most that many such coroutines
+    run at once; the others wait their turn on the I/O loop.
+    """
+    if limit is not None:
+        coro = _limited(limit, coro)
+    future = asyncio.run_coroutine_threadsafe(coro, get_io_loop())
+    return await asyncio.wrap_future(future)
+
+def get_tool_executor(name):
+    """Return the thread pool of a tool, sized by its TOOL_CONCURRENCY limit"""
+    with _tool_executors_lock:
+        if name not in _tool_executors:
+            _tool_executors[name] = ThreadPoolExecutor(
+                max_workers=TOOL_CONCURRENCY[name], thread_name_prefix=f"stylegenie-{name}"
+            )
+    return _tool_executors[name]
+
+async def run_blocking(name, fn, *args, **kwargs):
+    """Run a blocking call in a tool's thread pool and await it without blocking the event loop.
+
+    Calls beyond the tool's TOOL_CONCURRENCY limit queue for a free thread.
+    The caller's context (trace spans and tags) is carried into the thread.
+    """
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_tool_executor(name), call)
+
+def get_genai_client():
+    """Return the process-wide genai client (use its .aio API through run_on_io_loop)"""
+    global _genai_client
+    with _genai_lock:
+        if _genai_client is None and is_fake_mode():
+            _genai_client = fakes.FakeGenaiClient(get_fake_profile("genai"))
+        elif _genai_client is None:
+            api_key = get_secret("GOOGLE_API_KEY") or get_secret("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("GOOGLE_API_KEY or GEMINI_API_KEY not found in secrets or environment variables")
+            _genai_client = genai.Client(api_key=api_key)
+    return _genai_client
+
+def get_tavily_client():
+    """Return the process-wide Tavily client"""
+    global _tavily_client
+    with _tavily_lock:
+        if _tavily_client is None and is_fake_mode():
+            _tavily_client = fakes.FakeTavilyClient(get_fake_profile("tavily"))
+        elif _tavily_client is None:
+            _tavily_client = TavilyClient(api_key=get_secret("TAVILY_API_KEY"))
+    return _tavily_client
+
+def get_memory_client():
+    """Return the process-wide mem0 client (creating one validates the API key with a network call)"""
+    global _memory_client
+    with _memory_lock:
+        if _memory_client is None and is_fake_mode():
+            _memory_client = fakes.FakeMemoryClient(get_fake_profile("memory"))
+        elif _memory_client is None:
+            api_key = get_secret("MEM0_API_KEY")
+            if not api_key:
+                raise ValueError("MEM0_API_KEY not found in secrets or environment variables")
+            _memory_client = MemoryClient(api_key)
+    return _memory_client
+
+def get_http_session():
+    """Return the process-wide requests session (pooled connections for plain HTTP APIs)"""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+    return _http_session
+
+def create_chat_model(model_id):
+    """Return the chat model for a new agent: GeminiModel, or FakeChatModel in fake mode"""
+    if is_fake_mode():
+        return fakes.FakeChatModel(get_fake_profile("chat_model"), model_id=model_id)
+    return GeminiModel(
+        client_args={'api_key': os.environ.get("GEMINI_API_KEY")},
+        model_id=model_id,
+    )
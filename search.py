@@ -0,0 +1,312 @@
+"""Web search for StyleGenie: parallel fan-out over the configured providers, with a TTL + LRU result cache."""
+import contextvars
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from serpapi import GoogleSearch
+
+from database import connection, transaction
+from providers import get_http_session, get_secret, get_tavily_client, is_fake_mode
+from tracing import span
+
+# Search settings
+SEARCH_DEPTH = "advanced"  # Tavily depth: "basic" is faster, "advanced" returns better shopping results
+MAX_RESULTS = 5
+SEARCH_LATENCY_BUDGET = 4.0  # Seconds to wait for providers before answering with what has arrived
+SEARCH_MIN_RESULTS = MAX_RESULTS  # Answer as soon as this many unique results have arrived
+SEARCH_WORKERS = 16  # Threads shared by all provider calls in the process
+
+# Cache settings
+SEARCH_CACHE_TTL = 6 * 60 * 60  # Seconds a cached result stays valid
+SEARCH_CACHE_SIZE = 1024  # Queries kept in memory (least recently used are evicted first)
+SEARCH_CACHE_PERSIST = False  # Also keep results in the search_cache table so they survive restarts
+SEARCH_CACHE_ROWS = 10000  # Rows kept in the search_cache table (oldest are deleted first)
+SEARCH_CACHE_PRUNE_EVERY = 100  # Persisted writes between two prunes of the search_cache table
+
+def normalize_query(query):
+    """Normalize a query for cache lookups: Unicode form, case and whitespace.
+
+    Case folding is locale-independent, and the providers are not given a
+    locale, so the same query gets the same results in every locale; a
+    locale component in the key would only split the cache.
+    """
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return re.sub(r"\s+", " ", query).strip()
+
+class SearchCache:
+    """Thread-safe TTL + LRU cache of search results, optionally persisted in SQLite"""
+
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, persist=SEARCH_CACHE_PERSIST,
+                 max_rows=SEARCH_CACHE_ROWS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self.max_rows = max_rows
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._entries = OrderedDict()  # key -> (stored_at, results)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached results for a key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        if self.persist:
+            with connection() as conn:
+                row = conn.execute(
+                    'SELECT results, created_at FROM search_cache WHERE cache_key = ?', (key,)
+                ).fetchone()
+            if row and now - row[1] < self.ttl:
+                results = json.loads(row[0])
+                self._store(key, results, row[1])
+                with self._lock:
+                    self.hits += 1
+                return results
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, results):
+        """Cache the results for a key"""
+        stored_at = time.time()
+        self._store(key, results, stored_at)
+        if self.persist:
+            with self._lock:
+                prune = self._writes % SEARCH_CACHE_PRUNE_EVERY == 0
+                self._writes += 1
+            with transaction() as cursor:
+                cursor.execute('''
+                    INSERT OR REPLACE INTO search_cache (cache_key, results, created_at)
+                    VALUES (?, ?, ?)
+                ''', (key, json.dumps(results, ensure_ascii=False), stored_at))
+                if prune:
+                    self._prune(cursor, stored_at)
+
+    def _prune(self, cursor, now):
+        """Delete expired rows from the search_cache table, then the oldest beyond max_rows"""
+        cursor.execute('DELETE FROM search_cache WHERE created_at <= ?', (now - self.ttl,))
+        cursor.execute('''
+            DELETE FROM search_cache WHERE cache_key IN (
+                SELECT cache_key FROM search_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_rows,))
+
+    def _store(self, key, results, stored_at):
+        with self._lock:
+            self._entries[key] = (stored_at, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters and the current hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+search_cache = SearchCache()
+
+def tavily_search(query, max_results=MAX_RESULTS):
+    """Search the web with Tavily"""
+    response = get_tavily_client().search(
+        query,
+        search_depth=SEARCH_DEPTH,
+        max_results=max_results
+    )
+    return [
+        {
+            'title': result.get('title', 'No title'),
+            'url': result.get('url', 'No URL'),
+            'content': result.get('content', 'No description'),
+            'score': result.get('score', 0)
+        }
+        for result in response.get('results', [])
+    ]
+
+def brave_search(query, max_results=MAX_RESULTS):
+    """Search the web with the Brave Search API"""
+    response = get_http_session().get(
+        "https://api.search.brave.com/res/v1/web/search",
+        params={"q": query, "count": max_results},
+        headers={"Accept": "application/json", "X-Subscription-Token": get_secret("BRAVE_API_KEY")},
+        timeout=SEARCH_LATENCY_BUDGET
+    )
+    response.raise_for_status()
+    return [
+        {
+            'title': result.get('title', 'No title'),
+            'url': result.get('url', 'No URL'),
+            'content': result.get('description', 'No description'),
+            'score': 0
+        }
+        for result in response.json().get('web', {}).get('results', [])[:max_results]
+    ]
+
+def serpapi_search(query, max_results=MAX_RESULTS):
+    """Search Google through SerpApi"""
+    response = GoogleSearch({"q": query, "num": max_results, "api_key": get_secret("SERP_API_KEY")}).get_dict()
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    return [
+        {
+            'title': result.get('title', 'No title'),
+            'url': result.get('link', 'No URL'),
+            'content': result.get('snippet', 'No description'),
+            'score': 0
+        }
+        for result in response.get('organic_results', [])[:max_results]
+    ]
+
+def linkup_search(query, max_results=MAX_RESULTS):
+    """Search the web with the Linkup API"""
+    response = get_http_session().post(
+        "https://api.linkup.so/v1/search",
+        json={"q": query, "depth": "standard", "outputType": "searchResults"},
+        headers={"Authorization": f"Bearer {get_secret('LINKUP_API_KEY')}"},
+        timeout=SEARCH_LATENCY_BUDGET
+    )
+    response.raise_for_status()
+    return [
+        {
+            'title': result.get('name', 'No title'),
+            'url': result.get('url', 'No URL'),
+            'content': result.get('content', 'No description'),
+            'score': 0
+        }
+        for result in response.json().get('results', [])[:max_results]
+    ]
+
+# Provider name -> (API key secret, search function); a provider is used when its key is configured.
+# A search function takes (query, max_results) and returns a list of {title, url, content, score} dicts.
+SEARCH_PROVIDERS = {
+    "tavily": ("TAVILY_API_KEY", tavily_search),
+    "brave": ("BRAVE_API_KEY", brave_search),
+    "serpapi": ("SERP_API_KEY", serpapi_search),
+    "linkup": ("LINKUP_API_KEY", linkup_search),
+}
+
+_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="stylegenie-search")
+
+def get_configured_providers():
+    """Return {name: search function} for every provider whose API key is configured"""
+    if is_fake_mode():
+        return {"tavily": tavily_search}  # Served by the fake Tavily client
+    return {
+        name: search_fn
+        for name, (secret_name, search_fn) in SEARCH_PROVIDERS.items()
+        if get_secret(secret_name)
+    }
+
+def normalize_url(url):
+    """Normalize a result URL for de-duplication (host case, fragment, tracking parameters, trailing slash)"""
+    parts = urlsplit(url.strip())
+    query = urlencode([
+        (key, value) for key, value in parse_qsl(parts.query)
+        if not key.lower().startswith("utm_")
+    ])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), query, ""))
+
+def timed_search(name, search_fn, query, max_results):
+    """Call one provider inside a tracing span"""
+    with span(f"search.{name}"):
+        return search_fn(query, max_results)
+
+def fan_out_search(query, providers, max_results=MAX_RESULTS, budget=SEARCH_LATENCY_BUDGET, min_results=SEARCH_MIN_RESULTS):
+    """Query all providers concurrently and merge their results, de-duplicated by URL.
+
+    Returns as soon as min_results unique results have arrived, every provider
+    has answered, or the latency budget is spent, whichever comes first.
+    Providers that are still running are left to finish in the background and
+    their results are dropped.
+    """
+    deadline = time.monotonic() + budget
+    pending = {
+        # Each provider call runs in a copy of the caller's context so its span joins the caller's trace
+        _executor.submit(contextvars.copy_context().run, timed_search, name, search_fn, query, max_results): name
+        for name, search_fn in providers.items()
+    }
+
+    merged = []
+    seen_urls = set()
+    answered = []
+    while pending and len(merged) < min_results:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Search provider {name} failed: {e}")
+                continue
+            answered.append(name)
+            for result in results:
+                url_key = normalize_url(result['url'])
+                if url_key not in seen_urls:
+                    seen_urls.add(url_key)
+                    merged.append({**result, 'source': name})
+
+    if pending:
+        print(f"Search answered without: {', '.join(pending.values())}")
+
+    return {
+        'results': merged,
+        'total_results': len(merged),
+        'providers': answered
+    }
+
+def search_web(query, providers=None):
+    """Search the web across providers, answering repeated queries from the cache.
+
+    providers maps names to search functions and defaults to every configured
+    provider; pass local stubs to exercise the fan-out without network access.
+    """
+    if providers is None:
+        providers = get_configured_providers()
+    if not providers:
+        return {'results': [], 'total_results': 0, 'providers': []}
+
+    key = f"{','.join(sorted(providers))}:{SEARCH_DEPTH}:{MAX_RESULTS}:{normalize_query(query)}"
+    with span("search.cache") as cache_span:
+        cached = search_cache.get(key)
+        stats = get_search_cache_stats()
+        if cache_span is not None:
+            cache_span.set_attribute("hit", cached is not None)
+            cache_span.set_attribute("hit_rate", round(stats["hit_rate"], 3))
+    print(f"Search cache {'hit' if cached is not None else 'miss'} "
+          f"(hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {stats['hit_rate']:.0%})")
+    if cached is not None:
+        return cached
+
+    results = fan_out_search(query, providers)
+    # Empty answers are not cached so a transient provider problem is retried next time
+    if results['results']:
+        search_cache.set(key, results)
+    return results
+
+def get_search_cache_stats():
+    """Return the search cache's hit/miss counters and hit rate"""
+    return search_cache.stats()
@@ -0,0 +1,443 @@
+"""The StyleGenie agent: system prompt, tools and agent construction.
+
+Nothing here depends on a Streamlit session, so the agent can also be
+driven directly (see benchmarks/load.py). Per-call data reaches the tools
+through the agent's invocation state (see new_turn_images).
+"""
+import json
+from io import BytesIO
+
+from google.genai import types
+from PIL import Image
+from strands import Agent, ToolContext, tool
+from strands.agent.conversation_manager import SummarizingConversationManager
+
+from countries import lookup_country
+from memory import memory_store
+from providers import create_chat_model, get_genai_client, run_blocking, run_on_io_loop
+from search import search_web
+from tracing import traced
+
+# System prompt
+style_genie_system_prompt = """<system_prompt>
+
+🧥 **STYLE GENIE — MULTILINGUAL AI FASHION DESIGNER, PERSONAL STYLIST & SHOPPING EXPERT**
+
+YOU ARE **STYLE GENIE**, THE WORLD’S MOST ADVANCED MULTILINGUAL AI FASHION ADVISOR.  
+YOUR MISSION IS TO **ASSIST USERS IN ANALYZING, STYLING, ENHANCING, AND SOURCING OUTFITS** WHILE MAINTAINING THEIR UNIQUE IDENTITY AND PERSONAL STYLE.
+
+---
+
+### 🌟 TONE & PERSONA
+
+- YOU SPEAK AS A **FRIENDLY, PROFESSIONAL, AND ENTHUSIASTIC STYLIST** — confident but never arrogant.  
+- YOUR VOICE IS **CONVERSATIONAL, POSITIVE, AND CREATIVE**, blending expertise with encouragement.  
+- USE contractions naturally (e.g., “I’ll”, “you’re”, “that’s”).  
+- KEEP messages concise but insightful — aim for clarity, warmth, and excitement.
+
+---
+
+### 🧠 MEMORY SYSTEM INTEGRATION
+
+YOU HAVE ACCESS TO THREE MEMORY TOOLS:
+
+- **`add_memories(prompt, user_id)`** → STORE new user information (preferences, brands, colors, etc.)  
+- **`search_memories(prompt, user_id)`** → RECALL previously discussed topics  
+- **`get_all_memories(prompt, user_id)`** → RETRIEVE all stored user data for personalization  
+
+#### RULES FOR MEMORY BEHAVIOR
+1. **CALL `get_all_memories()` ON FIRST MESSAGE** in a new session to check if data exists, unless the message already contains a `[Memory snapshot]` with its result.  
+2. **ASK POLITELY FOR USER’S NAME** only if no memory exists. Example:  
+   > “To personalize your experience, could you please tell me your name?”  
+3. **ONCE NAME IS GIVEN**, immediately store it using `add_memories("User's name is [name]", "{USER_ID}")`.  
+4. **NEVER ASK AGAIN** for name or data already known in the current session.  
+5. **WHEN USER REFERS TO PAST DISCUSSIONS**, use `search_memories()` to recall context.  
+6. **SUMMARIZE STORED DATA NATURALLY**, never print raw memory content.  
+7. **ONLY STORE FACTUAL USER-APPROVED INFORMATION**, not assumptions or inferred data.  
+
+---
+
+### 🪪 USER IDENTITY MANAGEMENT
+
+- Each session uses a persistent `"{USER_ID}"`.  
+- All memory operations MUST use this same identifier.  
+- If a user refuses to share their name, reply courteously:  
+  > “No problem! I’ll continue without saving your preferences this time.”  
+- Do not attempt to infer the user’s name or private information.
+
+---
+
+### 🧭 CORE CAPABILITIES
+
+1. **STYLE ANALYSIS** — Analyze uploaded outfits and describe key elements (fit, color, aesthetic).  
+2. **OUTFIT MODIFICATION** — Use `generate_image(prompt)` to apply style changes while **preserving the user’s identity**.  
+3. **SHOPPING ASSISTANCE** — Find product links or alternatives using `web_search()`. **ALWAYS include relevant URLs from search results in your response** when providing shopping recommendations or product information. **ALWAYS ask for country and budget if not already known** when the user requests outfit searches or links. If an outfit was just generated, ask if they want to search for the original image or the generated one. Use `user_country()` to adapt to local trends and availability.  
+4. **CULTURAL CONTEXTUALIZATION** — When asked, adapt style advice to local weather, traditions, or trends using `user_country()`.  
+5. **MEMORY-AWARE PERSONALIZATION** — Integrate user history into every response.  
+6. **MULTILINGUAL DIALOGUE** — Respond fluently and consistently in the user’s active language.  
+
+---
+
+### 🌐 MULTILINGUAL BEHAVIOR RULES
+
+- **DETECT** the language of the latest user message.  
+- **RESPOND** in that exact language unless explicitly told otherwise.  
+- **MAINTAIN CONSISTENCY** in tone across languages — friendly, refined, confident.  
+- If detection fails, default to English and add:  
+  > “I’ll respond in English for now — feel free to switch languages anytime!”
+
+---
+
+### 🖼️ IMAGE GENERATION PROTOCOL
+
+- When modifying outfits, call **`generate_image(detailed_prompt)`**.  
+- ENSURE:
+  - Only requested changes are made (e.g., jacket → leather, color → white).  
+  - Face, body, and background remain untouched.  
+  - Output looks **photorealistic and natural**.  
+- If no image is uploaded, reply politely:  
+  > “Please upload an image so I can visualize your outfit adjustments.”
+
+---
+
+### ⚙️ WORKFLOW SUMMARY
+
+| **User Intent** | **Action Sequence** |
+|------------------|--------------------|
+| First message | `get_all_memories("user info", "{USER_ID}")` → check if name exists (skip if a `[Memory snapshot]` is provided) |
+| No name stored | Ask politely → save name with `add_memories()` |
+| **User Style Edit Request** | **IMMEDIATELY** `generate_image(detailed_prompt)` → factual description → optionally `web_search()` for similar items → **Optional Suggestion** |
+| Shopping request | Ask for missing info (country/budget) → use `user_country()` + `web_search()` |
+| Feedback or opinion | Use `search_memories()` if relevant → provide insight and new suggestion |
+| New preference shared | Save via `add_memories()` immediately |
+
+---
+
+### 🧩 CHAIN OF THOUGHT PROCESS
+
+FOLLOW THIS INTERNAL REASONING SEQUENCE (DO NOT DISPLAY TO USER):
+
+1. **UNDERSTAND** → Identify what the user wants (e.g., advice, image edit, outfit match).  
+2. **CHECK SESSION CONTEXT** → Determine if it’s a new chat or continuation.  
+3. **BASICS** → Extract garments, preferences, or missing data (country, budget).  
+4. **ANALYZE** → Search or recall past preferences via memory tools if needed.  
+5. **EXECUTE** → Perform the primary action (style advice, search, or image generation).  
+6. **EVALUATE** → Verify if the result fulfills the user’s intent; refine if needed.  
+7. **FINAL ANSWER** → Present response in the user’s language, with enthusiasm and clear formatting.
+
+---
+
+### 🧷 RESPONSE FORMATTING GUIDELINES
+
+- ALWAYS combine **visual description + reasoning + suggestion**.  
+- Structure with clear paragraph breaks.  
+- When applicable, end with a **friendly CTA (call to action)** such as:  
+  > “Would you like me to create a visual version of that?” or  
+  > “Want me to find some shopping links for this look?”
+
+---
+
+### 🚫 WHAT NOT TO DO
+
+- ❌ NEVER show or reveal raw memory data or database content.  
+- ❌ NEVER ask for the user’s name or data more than once per session.  
+- ❌ NEVER modify a person’s face, body, or pose during image generation.  
+- ❌ NEVER switch languages unless explicitly requested.  
+- ❌ NEVER provide brand links without verifying via `web_search()`.  
+- ❌ NEVER produce generic fashion advice without personalization or reasoning.  
+- ❌ NEVER repeat tool outputs verbatim — always explain results conversationally.
+
+---
+
+### ✅ EXAMPLES (FEW-SHOT)
+
+**User:** “Change my jacket to white leather.”  
+**Assistant:**  
+> “Got it! I’ll transform your jacket into a white leather style while keeping everything else identical — including your pose and lighting. Let’s see the result!”  
+→ *(Calls `generate_image()`)*
+
+---
+
+**User:** “I love minimalist tones.”  
+**Assistant:**  
+> “Perfect — I’ll remember that. You seem drawn to clean lines and neutral shades. Want me to find similar outfits online?”  
+→ *(Calls `add_memories()` and optionally `web_search()`)*
+
+---
+
+**User:** “Find me summer outfits for Italy.”  
+**Assistant:**  
+> “Excellent choice! Let’s tailor your look for the Italian summer vibe — light fabrics, Mediterranean colors. Checking current trends...”  
+→ *(Calls `user_country("Italy")` + `web_search("Italian summer fashion")`)*
+
+---
+
+</system_prompt>
+
+
+"""
+
+def read_image_response(response, turn_images):
+    """Collect the text of an image-editing response and add its images to the turn's generated images.
+
+    Returns (text, last generated PIL image or None).
+    """
+    full_response = ""
+    generated_image = None
+    
+    try:
+        for part in response.candidates[0].content.parts:
+            if part.text is not None:
+                full_response += part.text
+            elif part.inline_data is not None:
+                try:
+                    generated_image = Image.open(BytesIO(part.inline_data.data))
+
+                    # Validate image dimensions
+                    if generated_image.size[0] <= 0 or generated_image.size[1] <= 0:
+                        print(f"Invalid image dimensions: {generated_image.size}")
+                        full_response = "Error: Generated image has invalid dimensions. Please try again."
+                        generated_image = None
+                        continue
+
+                    # Convert image to bytes for display in chat
+                    img_byte_arr = BytesIO()
+                    generated_image.save(img_byte_arr, format='PNG')
+                    image_bytes = img_byte_arr.getvalue()
+
+                    # Hand the image back to the chat loop through this turn's images
+                    turn_images["generated_images"].append(image_bytes)
+
+                    print(f"Image generated successfully and stored in memory: {len(image_bytes)} bytes")
+                except Exception as img_error:
+                    print(f"Error processing generated image: {img_error}")
+                    full_response = f"Error processing generated image: {str(img_error)}. Please try again."
+                    generated_image = None
+    except Exception as ex:
+        full_response = f"ERROR in image generation: {str(ex)}"
+        generated_image = None
+    
+    return full_response, generated_image
+
+
+# Tool definitions
+@tool(context=True)
+@traced("tool.generate_image")
+async def generate_image(prompt: str, tool_context: ToolContext) -> str:
+    """" 
+    This function allows you to generate an image based on the user's query.
+    It modifies the current image that the user uploaded while preserving their identity.
+
+    Args :
+
+    prompt : the user's modification request (e.g., "change the jacket to white leather")
+
+    Returns :
+
+    Status message indicating success or failure
+    
+    """
+    # Images of the calling session's current turn are passed with each agent call (see new_turn_images)
+    turn_images = tool_context.invocation_state.get("turn_images") or new_turn_images()
+    current_image_bytes = turn_images["source_image"]
+    
+    if current_image_bytes is None:
+        return "Error: No image available to modify. Please upload an image first."
+
+    system_prompt = """You are an AI image editor specializing in outfit modifications. 
+When modifying clothing in images, you must:
+- Change ONLY the requested clothing items, colors, or accessories
+- Preserve the person's face, body, pose, hairstyle, and background exactly as they are
+- Keep all other elements of the image unchanged
+- Generate realistic and natural-looking results
+- The input image shows the person whose outfit you need to modify"""
+    
+    try:
+        # Shared, connection-pooled client (created once per process)
+        client = get_genai_client()
+    except ValueError as e:
+        return f"Error: {e}"
+    
+    try:
+        # Get image bytes from this turn's images
+        image_bytes = current_image_bytes
+        
+        # Create the image part from bytes
+        image_part = types.Part.from_bytes(
+            data=image_bytes,
+            mime_type="image/jpeg"
+        )
+        
+        # Send both the original image and the modification prompt; the async call runs on the
+        # shared I/O loop so the agent's event loop (and other sessions' edits) are not blocked
+        response = await run_on_io_loop(client.aio.models.generate_content(
+            model="gemini-2.5-flash-image-preview",
+            contents=[image_part, prompt],
+            config=types.GenerateContentConfig(
+                system_instruction=system_prompt,
+                response_modalities=['Text', 'Image']
+            )
+        ), limit="generate_image")
+
+        # Decoding and re-encoding the image is CPU work, so it runs in the tool's thread pool
+        full_response, generated_image = await run_blocking("generate_image", read_image_response, response, turn_images)
+        
+        if generated_image is not None:
+            return "Image successfully modified and saved. The person's identity and pose have been preserved."
+        else:
+            return full_response if full_response else "Image modification completed but no image was generated in the response."
+    
+    except Exception as e:
+        import traceback
+        error_details = traceback.format_exc()
+        print(f"Error in generate_image: {error_details}")
+        return f"Error generating image: {str(e)}"
+
+
+@tool
+@traced("tool.web_search")
+async def web_search(search: str) -> dict:
+    """
+    This function allows the model to make searches online based on a subject given by the user.
+    
+    Args:
+        search: the user's query
+    
+    Returns:
+        Dictionary with search results including titles, URLs, and content snippets
+    """
+    # Repeated queries are answered from the process-wide search cache; misses block on
+    # the providers, so the search runs in the tool's thread pool
+    return await run_blocking("web_search", search_web, search)
+
+
+@tool
+@traced("tool.user_country")
+async def user_country(name: str) -> dict:
+    """
+    This function allows you to find information about the user's country.
+    The name can be in English or in the user's language, or an ISO code.
+    """
+    # Looked up in the country index built once at startup (in memory, nothing to offload)
+    country = lookup_country(name)
+    if country is None:
+        return {'error': f"Country not found: {name}"}
+    return dict(country)
+
+
+@tool
+@traced("tool.add_memories")
+async def add_memories(prompt: str, user_id: str) -> dict:
+    """
+    This function tool allows you to save the user's message.
+    
+    Args:
+        prompt: the user's query
+        user_id: the user's id
+    
+    Returns:
+        The status of the function tool usage
+    """
+    # The write is queued and sent to mem0 in the background
+    try:
+        await run_blocking("add_memories", memory_store.add, prompt, user_id)
+        print(f"Memory queued for user: {user_id}")
+        return {"status": "success"}
+    except Exception as e:
+        print(f"Error adding memory for user {user_id}: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+@tool
+@traced("tool.search_memories")
+async def search_memories(prompt: str, user_id: str) -> dict:
+    """
+    This function tool allows you to search for relevant memories.
+    
+    Args:
+        prompt: the search query
+        user_id: the user's id
+    
+    Returns:
+        The status of the function tool usage
+    """
+    try:
+        results = await run_blocking("search_memories", memory_store.search, prompt, user_id)
+        num_results = len(results) if results else 0
+        print(f"Memory search successful for user: {user_id}, found {num_results} results")
+        return {"status": "success", "results": results}
+    except Exception as e:
+        print(f"Error searching memories for user {user_id}: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+def memories_result(all_memories, pending):
+    """Build the get_all_memories tool result"""
+    result = {"status": "success", "memories": all_memories}
+    if pending:
+        # Saved this session but not yet processed by mem0
+        result["pending"] = pending
+    return result
+
+def memory_snapshot_input(user_id, snapshot):
+    """Agent input entry carrying memories prefetched at session start, in place of the first get_all_memories call"""
+    all_memories, pending = snapshot
+    result = json.dumps(memories_result(all_memories, pending), ensure_ascii=False, default=str)
+    return {
+        "text": (
+            f'[Memory snapshot] get_all_memories("user info", "{user_id}") was already called for this session '
+            f"and returned: {result}\nUse this instead of calling get_all_memories for this message."
+        ),
+        "role": "user",
+    }
+
+@tool
+@traced("tool.get_all_memories")
+async def get_all_memories(prompt: str, user_id: str) -> dict:
+    """
+    This function allows you to retrieve all memories of a user.
+    
+    Args:
+        prompt: the user's query
+        user_id: the user's id
+    
+    Returns:
+        The status of the function tool usage
+    """
+    # Answered from the per-user memory cache until the user's next write lands
+    try:
+        all_memories, pending = await run_blocking("get_all_memories", memory_store.get_all, user_id)
+        print(f"Retrieved {len(all_memories) if all_memories else 0} memories for user: {user_id}")
+        return memories_result(all_memories, pending)
+    except Exception as e:
+        print(f"Error getting all memories for user {user_id}: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+# Initialize the agent
+def initialize_agent(user_id):
+    """Initialize agent with user-specific system prompt"""
+    # Inject the actual user_id into the system prompt
+    personalized_prompt = style_genie_system_prompt.replace("{USER_ID}", user_id)
+    
+    model = create_chat_model("gemini-2.5-flash")
+    
+    agent = Agent(
+        model=model,
+        tools=[generate_image, user_country, web_search, get_all_memories, search_memories, add_memories],
+        system_prompt=personalized_prompt,
+        conversation_manager=SummarizingConversationManager()
+    )
+    
+    return agent
+
+
+def new_turn_images(source_image=None):
+    """Create the image context of a single agent call.
+
+    It is passed to the agent as invocation state ({"turn_images": ...}) and
+    resolved by the tools from their ToolContext, so each call, and therefore
+    each session, only ever sees its own images: "source_image" is the image
+    the tools may edit and "generated_images" collects what they produce.
+    """
+    return {"source_image": source_image, "generated_images": []}
@@ -0,0 +1,217 @@
+"""Latency tracing for StyleGenie: timed spans around agent turns, tools, database helpers and image work.
+
+Spans nest through context variables, so a span opened inside a tool becomes
+a child of that tool's span, and every span carries the tags of the
+surrounding trace context (session and conversation). Finished spans go to
+the sinks selected by the TRACE_SINK setting:
+
+- "jsonl": one JSON object per span appended to TRACE_FILE
+- "otel": re-emitted through the OpenTelemetry API and exported over OTLP
+  (needs strands-agents[otel]; configure with the standard OTEL_* variables),
+  where they also become parents of Strands' own agent and model spans
+- unset: no sink; spans are only kept for collect() (the in-app latency panel)
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+TRACE_FILE = "traces.jsonl"  # JSONL sink output file
+
+_current_span = contextvars.ContextVar("stylegenie_span", default=None)
+_tags = contextvars.ContextVar("stylegenie_trace_tags", default={})
+_collector = contextvars.ContextVar("stylegenie_trace_collector", default=None)
+
+_sinks = None
+_sinks_lock = threading.Lock()
+
+class JsonlSink:
+    """Append finished spans to a JSONL file"""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def on_start(self, span):
+        pass
+
+    def on_end(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+class OpenTelemetrySink:
+    """Mirror spans as OpenTelemetry spans, exported over OTLP"""
+
+    def __init__(self):
+        from opentelemetry import context, trace
+        from strands.telemetry import StrandsTelemetry
+
+        # Installs the SDK tracer provider (also used by Strands' spans) with an OTLP exporter
+        StrandsTelemetry().setup_otlp_exporter()
+        self._context = context
+        self._trace = trace
+        self._tracer = trace.get_tracer("stylegenie")
+
+    def on_start(self, span):
+        otel_span = self._tracer.start_span(span.name, attributes=span.otel_attributes())
+        span.sink_state["otel_span"] = otel_span
+        span.sink_state["otel_token"] = self._context.attach(self._trace.set_span_in_context(otel_span))
+
+    def on_end(self, span):
+        otel_span = span.sink_state.pop("otel_span")
+        self._context.detach(span.sink_state.pop("otel_token"))
+        otel_span.set_attributes(span.otel_attributes())
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end()
+
+def get_sinks():
+    """Return the configured sinks, created on first use (after the app has loaded its .env)"""
+    global _sinks
+    if _sinks is not None:
+        return _sinks
+    with _sinks_lock:
+        if _sinks is None:
+            sink_name = (os.environ.get("TRACE_SINK") or "").strip().lower()
+            _sinks = []
+            if sink_name == "jsonl":
+                _sinks.append(JsonlSink(os.environ.get("TRACE_FILE", TRACE_FILE)))
+            elif sink_name == "otel":
+                try:
+                    _sinks.append(OpenTelemetrySink())
+                except ImportError as e:
+                    print(f"OpenTelemetry tracing unavailable (install strands-agents[otel]): {e}")
+            elif sink_name:
+                print(f"Unknown TRACE_SINK: {sink_name}")
+    return _sinks
+
+def add_sink(sink):
+    """Register an extra sink next to the configured ones (e.g. an in-process collector for a load test)"""
+    sinks = get_sinks()
+    with _sinks_lock:
+        sinks.append(sink)
+
+class Span:
+    """One timed operation"""
+
+    def __init__(self, name, attributes, parent):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = {**_tags.get(), **attributes}
+        self.start_time = time.time()
+        self.duration_ms = None
+        self.error = None
+        self.sink_state = {}
+        self._start = time.perf_counter()
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, error=None):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    def otel_attributes(self):
+        return {
+            f"stylegenie.{key}": value if isinstance(value, (str, bool, int, float)) else str(value)
+            for key, value in self.attributes.items()
+        }
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+def is_enabled():
+    """True when finished spans have somewhere to go (a sink or an active collector)"""
+    return _collector.get() is not None or bool(get_sinks())
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as a span; yields the Span (None when tracing is disabled)"""
+    if not is_enabled():
+        yield None
+        return
+
+    current = Span(name, attributes, _current_span.get())
+    sinks = get_sinks()
+    for sink in sinks:
+        sink.on_start(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.finish(e)
+        raise
+    else:
+        current.finish()
+    finally:
+        _current_span.reset(token)
+        collected = _collector.get()
+        if collected is not None:
+            collected.append(current)
+        for sink in reversed(sinks):
+            try:
+                sink.on_end(current)
+            except Exception as e:
+                print(f"Error exporting span {current.name}: {e}")
+
+def traced(name=None):
+    """Decorator timing every call of a sync or async function as a span (named after the function by default)"""
+    def decorate(fn):
+        span_name = name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def set_tags(**tags):
+    """Tag every span started from now on in this context (e.g. session and conversation ids)"""
+    _tags.set({**_tags.get(), **tags})
+
+@contextmanager
+def collect():
+    """Collect the spans finished inside the block; yields the list they are appended to"""
+    spans = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+def latency_breakdown(spans):
+    """Summarize collected spans by name: [{"name", "calls", "total_ms", "max_ms"}], slowest first"""
+    summary = {}
+    for finished in spans:
+        entry = summary.setdefault(finished.name, {"name": finished.name, "calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+        entry["calls"] += 1
+        entry["total_ms"] += finished.duration_ms
+        entry["max_ms"] = max(entry["max_ms"], finished.duration_ms)
+    return sorted(summary.values(), key=lambda entry: entry["total_ms"], reverse=True)